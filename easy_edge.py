@@ -30,12 +30,33 @@ import sys
 import urllib.request
 import zipfile
 import psutil
+import numpy as np
 import time
+import random
+import csv
+import math
+import threading
+import itertools
+import multiprocessing
+import asyncio
+import queue
+import atexit
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import mmap
+import codecs
+import functools
+import ctypes
+import ctypes.util
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from rich.table import Table
 from rich import box
 
 # Try to import llama-cpp-python
 try:
+    import llama_cpp
     from llama_cpp import Llama
 except ImportError:
     print("Error: llama-cpp-python not installed. Run: pip install llama-cpp-python")
@@ -87,7 +108,65 @@ class EasyEdge:
             if model_path.exists():
                 return model_path
         return None
-    
+
+    def load_llama(self, model_name: str, n_ctx: int = 2048, n_threads: Optional[int] = None, **kwargs) -> Llama:
+        """Load an installed model into a new Llama instance"""
+        model_path = self.get_model_path(model_name)
+        if not model_path:
+            raise FileNotFoundError(f"Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        if not instrumentation.enabled:
+            return Llama(
+                model_path=str(model_path),
+                n_ctx=n_ctx,
+                n_threads=n_threads or os.cpu_count(),
+                **kwargs
+            )
+        start_time = time.perf_counter()
+        try:
+            llm = Llama(
+                model_path=str(model_path),
+                n_ctx=n_ctx,
+                n_threads=n_threads or os.cpu_count(),
+                **kwargs
+            )
+        except Exception:
+            instrumentation.errors.inc(model=model_name, phase="load")
+            raise
+        instrumentation.load_seconds.observe(time.perf_counter() - start_time, model=model_name)
+        return InstrumentedLlama(llm, model_name)
+
+    def load_slots(self, model_name: str, slots: int, n_ctx: int = 2048):
+        """Load engines for `slots` concurrent sequences; returns (engines, BatchedLlama or None).
+
+        More than one slot is decoded as a batch in a single context. Models
+        or llama-cpp-python builds that can't do that get one context per
+        slot instead, with the cores split between them.
+        """
+        model_path = self.get_model_path(model_name)
+        if not model_path:
+            raise FileNotFoundError(f"Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        if slots > 1:
+            start_time = time.perf_counter()
+            try:
+                batched = BatchedLlama(model_path, slots, n_ctx=n_ctx, model_name=model_name)
+            except (AttributeError, RuntimeError) as e:
+                console.print(f"[bold yellow]Batched decoding unavailable ({e}); using one context per slot.[/bold yellow]")
+            else:
+                if instrumentation.enabled:
+                    instrumentation.load_seconds.observe(time.perf_counter() - start_time, model=model_name)
+                return batched.slot_engines(), batched
+        threads = max(1, (os.cpu_count() or 1) // slots)
+        return [self.load_llama(model_name, n_ctx=n_ctx, n_threads=threads) for _ in range(slots)], None
+
+    def generation_params(self) -> Dict[str, Any]:
+        """Default sampling parameters from the settings"""
+        return {
+            "max_tokens": self.config["settings"]["max_tokens"],
+            "temperature": self.config["settings"]["temperature"],
+            "top_p": self.config["settings"]["top_p"],
+            "stop": ["User:", "\n\n"]
+        }
+
     def download_model(self, model_url: str) -> Path:
         """Download a model from URL using Hugging Face hub"""
         try:
@@ -199,7 +278,8 @@ class EasyEdge:
         for name, info in self.config["models"].items():
             size_mb = info.get("size", 0) / (1024 * 1024)
             status = "✅" if (self.models_dir / info["filename"]).exists() else "❌"
-            console.print(f"  {status} {name} ({size_mb:.1f} MB)")
+            boot = ", warm on boot" if name in self.config.get("warm_on_boot", []) else ""
+            console.print(f"  {status} {name} ({size_mb:.1f} MB{boot})")
     
     def run_model(self, model_name: str, prompt: str = None, interactive: bool = False):
         """Run a model for inference"""
@@ -211,11 +291,7 @@ class EasyEdge:
         
         try:
             console.print(f"Loading model {model_name}...")
-            llm = Llama(
-                model_path=str(model_path),
-                n_ctx=2048,
-                n_threads=os.cpu_count()
-            )
+            llm = self.load_llama(model_name)
             
             if interactive:
                 self.interactive_chat(llm, model_name)
@@ -231,7 +307,8 @@ class EasyEdge:
                     stop=["User:", "\n\n"]
                 )
                 
-                console.print(Panel(response["choices"][0]["text"], title="Response"))
+                with instrumentation.phase("render", model_name):
+                    console.print(Panel(response["choices"][0]["text"], title="Response"))
                 
         except Exception as e:
             console.print(f"❌ Error running model: {e}")
@@ -270,8 +347,1844 @@ class EasyEdge:
         
         console.print("\nGoodbye!")
 
-def parse_modelfile(modelfile_path):
-    """Parse a Modelfile and return a dict of its instructions."""
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class Counter:
+    """Monotonic counter with labelled series"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+class Histogram:
+    """Cumulative-bucket histogram with labelled series"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+class Instrumentation:
+    """Per-phase inference metrics with Prometheus text and OTLP/JSON exporters.
+
+    Disabled by default. While disabled, ``EasyEdge.load_llama`` returns the
+    bare ``Llama`` and nothing is recorded, so there is no per-call overhead.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start_time_ns = time.time_ns()
+        self.metrics = []
+        self.load_seconds = self._add(Histogram("easy_edge_model_load_seconds", "Time to construct a Llama from a GGUF file", SECONDS_BUCKETS))
+        self.ttft_seconds = self._add(Histogram("easy_edge_time_to_first_token_seconds", "Time from call to first generated token", SECONDS_BUCKETS))
+        self.request_seconds = self._add(Histogram("easy_edge_request_seconds", "End-to-end duration of a completion call", SECONDS_BUCKETS))
+        self.prefill_tps = self._add(Histogram("easy_edge_prefill_tokens_per_second", "Prompt evaluation speed", TOKENS_PER_SECOND_BUCKETS))
+        self.decode_tps = self._add(Histogram("easy_edge_decode_tokens_per_second", "Generation speed after the first token", TOKENS_PER_SECOND_BUCKETS))
+        self.phase_seconds = self._add(Histogram("easy_edge_phase_seconds", "Time spent in tokenization, sampling and output rendering", SECONDS_BUCKETS))
+        self.requests = self._add(Counter("easy_edge_requests_total", "Completion calls"))
+        self.prompt_tokens = self._add(Counter("easy_edge_prompt_tokens_total", "Prompt tokens processed"))
+        self.completion_tokens = self._add(Counter("easy_edge_completion_tokens_total", "Tokens generated"))
+        self.errors = self._add(Counter("easy_edge_errors_total", "Failed loads and completion calls"))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def phase(self, name: str, model: str):
+        """Time a block as a named phase (no-op while disabled)"""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds.observe(time.perf_counter() - start_time, model=model, phase=name)
+
+    def prometheus_text(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        def labels_text(labels):
+            if not labels:
+                return ""
+            pairs = []
+            for key, value in labels:
+                value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                pairs.append(f'{key}="{value}"')
+            return "{" + ",".join(pairs) + "}"
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            with metric._lock:
+                series = sorted(metric.series.items())
+            for labels, value in series:
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}{labels_text(labels)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{metric.name}_bucket{labels_text(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{metric.name}_sum{labels_text(labels)} {total}")
+                lines.append(f"{metric.name}_count{labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def otlp_json(self) -> Dict[str, Any]:
+        """Render all metrics as an OTLP/JSON ExportMetricsServiceRequest"""
+        now = str(time.time_ns())
+        start = str(self.start_time_ns)
+        metrics = []
+        for metric in self.metrics:
+            with metric._lock:
+                series = sorted(metric.series.items())
+            points = []
+            for labels, value in series:
+                point = {
+                    "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in labels],
+                    "startTimeUnixNano": start,
+                    "timeUnixNano": now,
+                }
+                if metric.kind == "counter":
+                    point["asDouble"] = value
+                else:
+                    counts, total, count = value
+                    point.update({"count": str(count), "sum": total,
+                                  "bucketCounts": [str(c) for c in counts],
+                                  "explicitBounds": [float(b) for b in metric.buckets]})
+                points.append(point)
+            body = {"dataPoints": points, "aggregationTemporality": 2}
+            if metric.kind == "counter":
+                metrics.append({"name": metric.name, "description": metric.description, "sum": {**body, "isMonotonic": True}})
+            else:
+                metrics.append({"name": metric.name, "description": metric.description, "histogram": body})
+        return {"resourceMetrics": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "easy-edge"}}]},
+            "scopeMetrics": [{"scope": {"name": "easy_edge"}, "metrics": metrics}],
+        }]}
+
+    def export_otlp_file(self, path):
+        """Append one OTLP/JSON line to path (the OpenTelemetry file exporter format)"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.otlp_json()) + "\n")
+
+    def start_otlp_file_export(self, path, interval: float = 10.0):
+        """Export to path every interval seconds and once more at exit"""
+        def export_periodically():
+            while True:
+                time.sleep(interval)
+                self.export_otlp_file(path)
+        threading.Thread(target=export_periodically, name="easy-edge-otlp-export", daemon=True).start()
+        atexit.register(self.export_otlp_file, path)
+
+    def serve_prometheus(self, host: str = '127.0.0.1', port: int = 9464):
+        """Serve GET /metrics in Prometheus text format from a background thread"""
+        handler = type('MetricsHandler', (MetricsRequestHandler,), {'instrumentation': self})
+        server = ThreadingHTTPServer((host, port), handler)
+        threading.Thread(target=server.serve_forever, name="easy-edge-metrics", daemon=True).start()
+        return server
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the Prometheus text exposition at /metrics"""
+    instrumentation = None
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        data = self.instrumentation.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+instrumentation = Instrumentation()
+
+def llama_perf_context(llm):
+    """llama.cpp's prompt/generation counters for llm's context, or None if unavailable"""
+    try:
+        return llama_cpp.llama_perf_context(llm._ctx.ctx)
+    except Exception:
+        return None
+
+def stream_with_usage(llm, prompt, **params):
+    """Stream llm's completion, adding OpenAI-style usage to the final chunk.
+
+    Chunks are not tokens: llama-cpp-python holds back text that could start
+    a stop string or is an incomplete UTF-8 character. For a Llama the tokens
+    its sampler returns are counted instead, leaving out the end-of-generation
+    token, as its own non-streaming usage does. Other engines pass through.
+    """
+    stream = llm(prompt, stream=True, **params)
+    if not (isinstance(llm, llama_cpp.Llama) and hasattr(llm, '_model')):
+        try:
+            yield from stream
+        finally:
+            stream.close()
+        return
+    sample = llm.sample
+    sampled = 0
+    def counting_sample(*args, **kwargs):
+        nonlocal sampled
+        token = sample(*args, **kwargs)
+        if not llama_cpp.llama_vocab_is_eog(llm._model.vocab, token):
+            sampled += 1
+        return token
+    llm.sample = counting_sample
+    try:
+        for chunk in stream:
+            if chunk["choices"][0].get("finish_reason") and "usage" not in chunk:
+                chunk = {**chunk, "usage": {"completion_tokens": sampled}}
+            yield chunk
+    finally:
+        stream.close()
+        del llm.sample
+
+class InstrumentedLlama:
+    """Llama proxy that records per-phase timings and token counts for each call.
+
+    Prefill and decode speeds come from llama.cpp's own perf counters (reset
+    before each call), so they exclude Python overhead. The prompt is
+    tokenized here and passed on as tokens, so tokenization is timed without
+    being done twice. llama-cpp-python builds its sampler chains with perf
+    counters off, so sampling is timed around each ``sample`` call instead.
+    """
+
+    def __init__(self, llm, model_name: str):
+        self._llm = llm
+        self.model_name = model_name
+        self._sample_seconds = 0.0
+        init_sampler = getattr(llm, '_init_sampler', None)
+        if init_sampler is not None:
+            def timed_init_sampler(*args, **kwargs):
+                sampler = init_sampler(*args, **kwargs)
+                sample = sampler.sample
+                def timed_sample(*sample_args, **sample_kwargs):
+                    start_time = time.perf_counter()
+                    try:
+                        return sample(*sample_args, **sample_kwargs)
+                    finally:
+                        self._sample_seconds += time.perf_counter() - start_time
+                sampler.sample = timed_sample
+                return sampler
+            llm._init_sampler = timed_init_sampler
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def __call__(self, prompt, stream: bool = False, **kwargs):
+        self._reset_perf()
+        if isinstance(prompt, str) and prompt and kwargs.get('suffix') is None:
+            start_time = time.perf_counter()
+            prompt = self._llm.tokenize(prompt.encode('utf-8'), add_bos=True, special=True)
+            instrumentation.phase_seconds.observe(time.perf_counter() - start_time, model=self.model_name, phase="tokenize")
+        if stream:
+            return self._stream(prompt, kwargs)
+        start_time = time.perf_counter()
+        try:
+            response = self._llm(prompt, **kwargs)
+        except Exception:
+            instrumentation.errors.inc(model=self.model_name, phase="inference")
+            raise
+        usage = response.get("usage", {})
+        self._record(time.perf_counter() - start_time, None, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return response
+
+    def _stream(self, prompt, kwargs):
+        start_time = time.perf_counter()
+        first_token = None
+        completion_tokens = 0
+        usage = None
+        try:
+            for chunk in stream_with_usage(self._llm, prompt, **kwargs):
+                if first_token is None:
+                    first_token = time.perf_counter() - start_time
+                if chunk["choices"][0]["text"]:
+                    completion_tokens += 1
+                usage = chunk.get("usage", usage)
+                yield chunk
+        except Exception:
+            instrumentation.errors.inc(model=self.model_name, phase="inference")
+            raise
+        finally:
+            perf = llama_perf_context(self._llm)
+            prompt_tokens = perf.n_p_eval if perf is not None else 0
+            if usage is not None:
+                completion_tokens = usage["completion_tokens"]
+            self._record(time.perf_counter() - start_time, first_token, prompt_tokens, completion_tokens)
+
+    def _reset_perf(self):
+        self._sample_seconds = 0.0
+        try:
+            llama_cpp.llama_perf_context_reset(self._llm._ctx.ctx)
+        except Exception:
+            pass
+
+    def _record(self, elapsed: float, first_token: Optional[float], prompt_tokens: int, completion_tokens: int):
+        model = self.model_name
+        instrumentation.requests.inc(model=model)
+        instrumentation.request_seconds.observe(elapsed, model=model)
+        instrumentation.prompt_tokens.inc(prompt_tokens, model=model)
+        instrumentation.completion_tokens.inc(completion_tokens, model=model)
+        if self._sample_seconds:
+            instrumentation.phase_seconds.observe(self._sample_seconds, model=model, phase="sample")
+        perf = llama_perf_context(self._llm)
+        if perf is not None:
+            prefill, decode = perf.t_p_eval_ms / 1000.0, perf.t_eval_ms / 1000.0
+            if prefill > 0 and perf.n_p_eval:
+                instrumentation.prefill_tps.observe(perf.n_p_eval / prefill, model=model)
+            if decode > 0 and perf.n_eval:
+                instrumentation.decode_tps.observe(perf.n_eval / decode, model=model)
+            if first_token is None and perf.n_eval:
+                # Non-streaming call: prefill plus one decode step
+                first_token = prefill + decode / perf.n_eval
+        elif first_token is not None and completion_tokens > 1 and elapsed > first_token:
+            instrumentation.decode_tps.observe((completion_tokens - 1) / (elapsed - first_token), model=model)
+        if first_token is not None:
+            instrumentation.ttft_seconds.observe(first_token, model=model)
+
+class AsyncClient:
+    """asyncio API for running an installed model from Python.
+
+    Every llama-cpp call runs on a dedicated single-thread executor, so the
+    Llama object is only ever touched from one thread and the event loop is
+    never blocked. Cancelling a stream (or the task awaiting ``generate``)
+    stops generation at the next token.
+
+        async with AsyncClient("Llama-3.2-1B-Instruct-GGUF") as client:
+            text = await client.generate("Hello!")
+            async for token in client.stream("Tell me a story"):
+                print(token, end="")
+    """
+
+    def __init__(self, model_name: str, models_dir: Optional[str] = None, n_ctx: int = 2048, n_threads: Optional[int] = None, **llama_kwargs):
+        self.easy_edge = EasyEdge(models_dir)
+        self.model_name = model_name
+        if not self.easy_edge.get_model_path(model_name):
+            raise FileNotFoundError(f"Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        self._llama_kwargs = {"n_ctx": n_ctx, "n_threads": n_threads, **llama_kwargs}
+        self._llm = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="easy-edge")
+
+    async def load(self):
+        """Load the model now instead of on the first request"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._engine)
+
+    async def generate(self, prompt: str, **params) -> str:
+        """Generate a completion and return its text"""
+        pieces = []
+        async for text in self.stream(prompt, **params):
+            pieces.append(text)
+        return "".join(pieces)
+
+    async def stream(self, prompt: str, **params):
+        """Yield the completion text token by token"""
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+        stop = threading.Event()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(tokens.put_nowait, item)
+            except RuntimeError:
+                stop.set()  # the event loop is gone; nobody is listening
+
+        loop.run_in_executor(self._executor, self._produce, prompt, params, emit, stop)
+        try:
+            while True:
+                text, error = await tokens.get()
+                if error is not None:
+                    raise error
+                if text is None:
+                    return
+                yield text
+        finally:
+            stop.set()
+
+    async def close(self):
+        """Wait for running work to stop and release the model"""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._llm = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _engine(self):
+        if self._llm is None:
+            self._llm = self.easy_edge.load_llama(self.model_name, **self._llama_kwargs)
+        return self._llm
+
+    def _produce(self, prompt: str, params: Dict[str, Any], emit, stop: threading.Event):
+        """Run one streaming generation on the executor thread, handing tokens to emit"""
+        if stop.is_set():
+            return
+        try:
+            stream = self._engine()(prompt, stream=True, **{**self.easy_edge.generation_params(), **params})
+            try:
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    text = chunk["choices"][0]["text"]
+                    if text:
+                        emit((text, None))
+            finally:
+                stream.close()
+        except Exception as e:
+            emit((None, e))
+            return
+        emit((None, None))
+
+class Client:
+    """Blocking counterpart of AsyncClient, sharing its executor and model"""
+
+    def __init__(self, model_name: str, models_dir: Optional[str] = None, **kwargs):
+        self._client = AsyncClient(model_name, models_dir=models_dir, **kwargs)
+
+    def load(self):
+        """Load the model now instead of on the first request"""
+        self._client._executor.submit(self._client._engine).result()
+
+    def generate(self, prompt: str, **params) -> str:
+        """Generate a completion and return its text"""
+        return "".join(self.stream(prompt, **params))
+
+    def stream(self, prompt: str, **params):
+        """Yield the completion text token by token"""
+        tokens = queue.Queue()
+        stop = threading.Event()
+        self._client._executor.submit(self._client._produce, prompt, params, tokens.put, stop)
+        try:
+            while True:
+                text, error = tokens.get()
+                if error is not None:
+                    raise error
+                if text is None:
+                    return
+                yield text
+        finally:
+            stop.set()
+
+    def close(self):
+        """Wait for running work to stop and release the model"""
+        self._client._executor.shutdown()
+        self._client._llm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence (0.0 when empty)"""
+    if not values:
+        return 0.0
+    rank = min(len(values), max(1, math.ceil(pct / 100.0 * len(values))))
+    return values[rank - 1]
+
+class SchedulerFull(Exception):
+    """Raised when the request queue is at capacity"""
+
+class RequestCancelled(Exception):
+    """Raised when a request is cancelled before it completes"""
+
+class DeadlineExceeded(Exception):
+    """Raised when a request misses its deadline"""
+
+class ScheduledRequest:
+    """A generation request tracked by a RequestScheduler"""
+    _ids = itertools.count(1)
+
+    def __init__(self, prompt: str, client_id: str, params: Dict[str, Any], timeout: Optional[float] = None, on_token=None):
+        self.id = next(self._ids)
+        self.prompt = prompt
+        self.client_id = client_id
+        self.params = params
+        self.on_token = on_token
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + timeout if timeout else None
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.completion_tokens = 0
+        self.finish_reason = None
+        self.error = None
+        self._pieces = []
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._scheduler = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._pieces)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """Cancel the request; a running request stops at its next token"""
+        self._cancelled.set()
+        if self._scheduler is not None:
+            self._scheduler._discard(self, RequestCancelled(f"Request {self.id} was cancelled"))
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Block until the request finishes and return its result"""
+        end = time.monotonic() + timeout if timeout is not None else None
+        deadline = self.deadline
+        while not self._done.is_set():
+            limits = [t for t in (end, deadline) if t is not None]
+            remaining = max(0.0, min(limits) - time.monotonic()) if limits else None
+            if self._done.wait(remaining):
+                break
+            if end is not None and time.monotonic() >= end:
+                raise TimeoutError(f"Request {self.id} did not finish within {timeout}s")
+            if deadline is not None and time.monotonic() >= deadline:
+                # Drop it if still queued; a running request stops at its next token
+                if self._scheduler is not None:
+                    self._scheduler._discard(self, DeadlineExceeded(f"Request {self.id} missed its deadline"))
+                deadline = None
+        if self.error is not None:
+            raise self.error
+        return self.result()
+
+    def result(self) -> Dict[str, Any]:
+        """Generated text, usage and timings (seconds) for the request"""
+        def elapsed(start, stop):
+            return stop - start if start is not None and stop is not None else None
+        return {
+            "id": self.id,
+            "text": self.text,
+            "finish_reason": self.finish_reason,
+            "usage": {"completion_tokens": self.completion_tokens},
+            "wait_time": elapsed(self.submitted_at, self.started_at),
+            "ttft": elapsed(self.submitted_at, self.first_token_at),
+            "latency": elapsed(self.submitted_at, self.finished_at),
+        }
+
+    def _finish(self, error: Optional[Exception] = None):
+        self.finished_at = time.monotonic()
+        self.error = error
+        self._done.set()
+
+class RequestScheduler:
+    """Bounded, fair request queue in front of one or more inference slots.
+
+    Each slot owns one engine (a ``Llama``, or anything called the same way)
+    and one worker thread, so an engine is never used from two threads at once.
+    A slot picks up the next request as soon as its sequence finishes, so all
+    slots keep decoding while work is queued. Requests are taken round-robin
+    across clients, so one busy client cannot starve the others.
+    """
+
+    def __init__(self, engines, max_queue: int = 64, default_timeout: Optional[float] = None):
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self._queues = OrderedDict()  # client_id -> deque of requests, in round-robin order
+        self._live = {}
+        self._depth = 0
+        self._active = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "cancelled": 0, "expired": 0, "failed": 0}
+        self._wait_times = deque(maxlen=1024)
+        self._wait_total = 0.0
+        self._wait_count = 0
+        self._wait_max = 0.0
+        self._threads = []
+        for i, engine in enumerate(engines):
+            thread = threading.Thread(target=self._worker, args=(engine,), name=f"easy-edge-slot-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.slots = len(self._threads)
+
+    def submit(self, prompt: str, client_id: str = "default", timeout: Optional[float] = None, on_token=None, **params) -> ScheduledRequest:
+        """Queue a request; raises SchedulerFull when the queue is at capacity"""
+        request = ScheduledRequest(prompt, client_id, params,
+                                   timeout=timeout if timeout is not None else self.default_timeout,
+                                   on_token=on_token)
+        request._scheduler = self
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler has been shut down")
+            if self._depth >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise SchedulerFull(f"Request queue is full ({self.max_queue} waiting)")
+            self._queues.setdefault(client_id, deque()).append(request)
+            self._live[request.id] = request
+            self._depth += 1
+            self._stats["submitted"] += 1
+            self._cond.notify()
+        return request
+
+    def generate(self, prompt: str, client_id: str = "default", timeout: Optional[float] = None, **params) -> Dict[str, Any]:
+        """Submit a request and block until it completes"""
+        return self.submit(prompt, client_id=client_id, timeout=timeout, **params).wait()
+
+    def cancel(self, request_id: int) -> bool:
+        """Cancel a queued or running request by id"""
+        with self._cond:
+            request = self._live.get(request_id)
+        if request is None:
+            return False
+        request.cancel()
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, outcome counters and queue wait times (seconds)"""
+        with self._cond:
+            waits = sorted(self._wait_times)
+            return {
+                "queue_depth": self._depth,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "slots": self.slots,
+                "clients_waiting": len(self._queues),
+                **self._stats,
+                "wait_time_avg": self._wait_total / self._wait_count if self._wait_count else 0.0,
+                "wait_time_p50": percentile(waits, 50),
+                "wait_time_p95": percentile(waits, 95),
+                "wait_time_max": self._wait_max,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting requests, cancel queued ones and let running ones finish"""
+        with self._cond:
+            self._closed = True
+            pending = [request for queue in self._queues.values() for request in queue]
+            self._cond.notify_all()
+        for request in pending:
+            self._discard(request, RequestCancelled("Scheduler is shutting down"))
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_request(self) -> ScheduledRequest:
+        client_id, queue = next(iter(self._queues.items()))
+        request = queue.popleft()
+        del self._queues[client_id]
+        if queue:
+            self._queues[client_id] = queue
+        self._depth -= 1
+        return request
+
+    def _discard(self, request: ScheduledRequest, error: Exception) -> bool:
+        """Remove a still-queued request and fail it; False if it already started"""
+        with self._cond:
+            queue = self._queues.get(request.client_id)
+            if queue is None or request not in queue:
+                return False
+            queue.remove(request)
+            if not queue:
+                del self._queues[request.client_id]
+            self._depth -= 1
+            self._record_outcome(request, error)
+        request._finish(error)
+        return True
+
+    def _record_outcome(self, request: ScheduledRequest, error: Optional[Exception]):
+        self._live.pop(request.id, None)
+        if error is None:
+            self._stats["completed"] += 1
+        elif isinstance(error, RequestCancelled):
+            self._stats["cancelled"] += 1
+        elif isinstance(error, DeadlineExceeded):
+            self._stats["expired"] += 1
+        else:
+            self._stats["failed"] += 1
+
+    def _worker(self, engine):
+        while True:
+            with self._cond:
+                while not self._depth and not self._closed:
+                    self._cond.wait()
+                if not self._depth:
+                    return
+                request = self._next_request()
+                error = None
+                if request.cancelled:
+                    error = RequestCancelled(f"Request {request.id} was cancelled")
+                elif request.expired:
+                    error = DeadlineExceeded(f"Request {request.id} expired after waiting in the queue")
+                if error is not None:
+                    self._record_outcome(request, error)
+                else:
+                    request.started_at = time.monotonic()
+                    wait_time = request.started_at - request.submitted_at
+                    self._wait_times.append(wait_time)
+                    self._wait_total += wait_time
+                    self._wait_count += 1
+                    self._wait_max = max(self._wait_max, wait_time)
+                    self._active += 1
+            if error is not None:
+                request._finish(error)
+                continue
+            try:
+                self._run(engine, request)
+            except Exception as e:
+                error = e
+            with self._cond:
+                self._active -= 1
+                self._record_outcome(request, error)
+            request._finish(error)
+
+    def _run(self, engine, request: ScheduledRequest):
+        stream = stream_with_usage(engine, request.prompt, **request.params)
+        try:
+            for chunk in stream:
+                if request.cancelled:
+                    raise RequestCancelled(f"Request {request.id} was cancelled")
+                if request.expired:
+                    raise DeadlineExceeded(f"Request {request.id} missed its deadline")
+                choice = chunk["choices"][0]
+                if request.first_token_at is None:
+                    request.first_token_at = time.monotonic()
+                if choice["text"]:
+                    request._pieces.append(choice["text"])
+                    # Approximate until the engine reports usage with its final chunk
+                    request.completion_tokens += 1
+                    if request.on_token is not None:
+                        request.on_token(choice["text"])
+                if chunk.get("usage"):
+                    request.completion_tokens = chunk["usage"]["completion_tokens"]
+                if choice.get("finish_reason"):
+                    request.finish_reason = choice["finish_reason"]
+        finally:
+            stream.close()
+
+class BatchedSequence:
+    """One generation running as a sequence id inside a BatchedLlama"""
+
+    def __init__(self, seq_id: int, tokens, sampler, max_tokens: Optional[int], stop):
+        self.seq_id = seq_id
+        self.tokens = tokens
+        self.sampler = sampler
+        self.max_tokens = max_tokens if max_tokens and max_tokens > 0 else None
+        self.stop = [stop] if isinstance(stop, str) else [s for s in (stop or []) if s]
+        self.hold = max((len(s) for s in self.stop), default=1) - 1
+        self.decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+        self.prefilled = 0
+        self.pos = 0
+        self.next_token = None
+        self.generated = 0
+        self.text = ""
+        self.emitted = 0
+        self.sample_seconds = 0.0
+        self.cancelled = False
+        self.chunks = queue.Queue()
+
+    def push(self, text: str, finish_reason: Optional[str] = None):
+        chunk = {"choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}]}
+        if finish_reason is not None:
+            chunk["usage"] = {"prompt_tokens": len(self.tokens), "completion_tokens": self.generated,
+                              "total_tokens": len(self.tokens) + self.generated}
+        self.chunks.put(chunk)
+
+class BatchedLlama:
+    """Decodes the sequences of several slots together in one llama.cpp context.
+
+    CPU decoding is bound by memory bandwidth: each step streams all of the
+    weights whether it computes one token or eight. Separate contexts each pay
+    for that read, so slots that split the cores between them get little more
+    than one context would. Here every slot is a sequence id in a single
+    context (``n_seq_max=slots``, one KV cache), and one decode thread packs
+    the next token of every running sequence, plus chunks of newly arrived
+    prompts, into a single ``llama_batch`` per step.
+
+    ``slot_engines()`` returns one callable per slot, called like a streaming
+    ``Llama``, to hand to a RequestScheduler. Raises RuntimeError for models
+    that cannot be batched (encoder-decoder and recurrent architectures) and
+    AttributeError when the installed llama-cpp-python predates this API.
+    """
+
+    def __init__(self, model_path, slots: int, n_ctx: int = 2048, n_threads: Optional[int] = None, n_batch: int = 512, model_name: Optional[str] = None):
+        self.slots = slots
+        self.n_ctx = n_ctx  # per sequence
+        self.model_name = model_name or Path(model_path).stem
+        if slots > llama_cpp.llama_max_parallel_sequences():
+            raise RuntimeError(f"llama.cpp supports at most {llama_cpp.llama_max_parallel_sequences()} sequences per context")
+        llama_cpp.llama_backend_init()
+        self._model = llama_cpp.llama_model_load_from_file(str(model_path).encode('utf-8'), llama_cpp.llama_model_default_params())
+        if not self._model:
+            raise RuntimeError(f"Failed to load model from {model_path}")
+        self._ctx = None
+        self._batch = None
+        try:
+            if llama_cpp.llama_model_has_encoder(self._model) or llama_cpp.llama_model_is_recurrent(self._model):
+                raise RuntimeError("encoder-decoder and recurrent models cannot share a batched context")
+            params = llama_cpp.llama_context_default_params()
+            params.n_ctx = n_ctx * slots
+            params.n_batch = max(n_batch, 2 * slots)
+            params.n_seq_max = slots
+            params.kv_unified = True
+            params.n_threads = params.n_threads_batch = n_threads or os.cpu_count() or 1
+            self._ctx = llama_cpp.llama_init_from_model(self._model, params)
+            if not self._ctx:
+                raise RuntimeError("Failed to create a batched llama.cpp context")
+            self.n_batch = params.n_batch
+            self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, 1)
+            self._vocab = llama_cpp.llama_model_get_vocab(self._model)
+            self._memory = llama_cpp.llama_get_memory(self._ctx)
+        except BaseException:
+            self._free()
+            raise
+        self._piece_buffer = ctypes.create_string_buffer(64)
+        self._pending = deque()
+        self._running = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self.steps = 0
+        self.batched_tokens = 0
+        self._thread = threading.Thread(target=self._loop, name="easy-edge-batch-decode", daemon=True)
+        self._thread.start()
+
+    def slot_engines(self):
+        """One callable per slot, each bound to its own sequence id"""
+        return [functools.partial(self._generate, seq_id) for seq_id in range(self.slots)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Decode steps run and the average number of tokens in each batch"""
+        return {
+            "steps": self.steps,
+            "batched_tokens": self.batched_tokens,
+            "tokens_per_step": self.batched_tokens / self.steps if self.steps else 0.0,
+        }
+
+    def tokenize(self, text: str):
+        data = text.encode('utf-8')
+        size = len(data) + 8
+        buffer = (llama_cpp.llama_token * size)()
+        n = llama_cpp.llama_tokenize(self._vocab, data, len(data), buffer, size, True, True)
+        if n < 0:
+            size = -n
+            buffer = (llama_cpp.llama_token * size)()
+            n = llama_cpp.llama_tokenize(self._vocab, data, len(data), buffer, size, True, True)
+        return buffer[:n]
+
+    def close(self):
+        """Fail queued and running sequences, stop the decode thread and free the model"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._free()
+
+    def _free(self):
+        if self._batch is not None:
+            llama_cpp.llama_batch_free(self._batch)
+            self._batch = None
+        if self._ctx:
+            llama_cpp.llama_free(self._ctx)
+            self._ctx = None
+        if self._model:
+            llama_cpp.llama_model_free(self._model)
+            self._model = None
+
+    def _sampler(self, temperature: float, top_p: float, top_k: int, min_p: float, seed: Optional[int]):
+        chain = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        if temperature <= 0:
+            llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_greedy())
+            return chain
+        if seed is None:
+            seed = random.getrandbits(32)
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_k(top_k))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_top_p(top_p, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_min_p(min_p, 1))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_temp(temperature))
+        llama_cpp.llama_sampler_chain_add(chain, llama_cpp.llama_sampler_init_dist(seed & 0xFFFFFFFF))
+        return chain
+
+    def _generate(self, seq_id: int, prompt: str, stream: bool = True, max_tokens: Optional[int] = 16,
+                  temperature: float = 0.8, top_p: float = 0.95, top_k: int = 40, min_p: float = 0.05,
+                  stop=None, seed: Optional[int] = None, **kwargs):
+        """Stream a completion on sequence seq_id, in the chunk format of ``Llama``"""
+        start_time = time.perf_counter()
+        with instrumentation.phase("tokenize", self.model_name):
+            tokens = self.tokenize(prompt)
+        if not tokens:
+            raise ValueError("Prompt is empty after tokenization")
+        if len(tokens) >= self.n_ctx:
+            raise ValueError(f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx}")
+        seq = BatchedSequence(seq_id, tokens, self._sampler(temperature, top_p, top_k, min_p, seed), max_tokens, stop)
+        with self._cond:
+            if self._closed:
+                llama_cpp.llama_sampler_free(seq.sampler)
+                raise RuntimeError("Batched engine has been closed")
+            self._pending.append(seq)
+            self._cond.notify()
+        first_token = None
+        finished = False
+        chunk = {}
+        try:
+            while True:
+                chunk = seq.chunks.get()
+                if chunk is None:
+                    finished = True
+                    return
+                if isinstance(chunk, Exception):
+                    finished = True
+                    raise chunk
+                if first_token is None:
+                    first_token = time.perf_counter() - start_time
+                yield chunk
+        finally:
+            if not finished:
+                # The slot's sequence id is reused by its next request, so wait
+                # until the decode thread has dropped this one from the batch
+                seq.cancelled = True
+                with self._cond:
+                    self._cond.notify()
+                while not (chunk is None or isinstance(chunk, Exception)):
+                    chunk = seq.chunks.get()
+            if instrumentation.enabled:
+                self._record(seq, time.perf_counter() - start_time, first_token)
+
+    def _record(self, seq: BatchedSequence, elapsed: float, first_token: Optional[float]):
+        model = self.model_name
+        instrumentation.requests.inc(model=model)
+        instrumentation.request_seconds.observe(elapsed, model=model)
+        instrumentation.prompt_tokens.inc(seq.prefilled, model=model)
+        instrumentation.completion_tokens.inc(seq.generated, model=model)
+        if seq.sample_seconds:
+            instrumentation.phase_seconds.observe(seq.sample_seconds, model=model, phase="sample")
+        if first_token is not None:
+            instrumentation.ttft_seconds.observe(first_token, model=model)
+            if seq.generated > 1 and elapsed > first_token:
+                instrumentation.decode_tps.observe((seq.generated - 1) / (elapsed - first_token), model=model)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._running and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    for seq in [*self._pending, *self._running]:
+                        self._release(seq, RuntimeError("Batched engine is shutting down"))
+                    self._pending.clear()
+                    return
+                self._running.extend(self._pending)
+                self._pending.clear()
+            for seq in [seq for seq in self._running if seq.cancelled]:
+                self._release(seq)
+            if self._running:
+                try:
+                    self._step()
+                except Exception as e:
+                    for seq in self._running[:]:
+                        self._release(seq, e)
+
+    def _step(self):
+        """Decode one batch: a token for every generating sequence, then prompt chunks"""
+        batch = self._batch
+        outputs = []  # (sequence, index of its logits in the batch)
+        n = 0
+
+        def add(token, seq, logits):
+            nonlocal n
+            batch.token[n] = token
+            batch.pos[n] = seq.pos
+            batch.n_seq_id[n] = 1
+            batch.seq_id[n][0] = seq.seq_id
+            batch.logits[n] = logits
+            seq.pos += 1
+            n += 1
+
+        for seq in self._running:
+            if seq.next_token is not None:
+                add(seq.next_token, seq, True)
+                outputs.append((seq, n - 1))
+        for seq in self._running:
+            remaining = len(seq.tokens) - seq.prefilled
+            if not remaining or n >= self.n_batch:
+                continue
+            take = min(remaining, self.n_batch - n)
+            for token in seq.tokens[seq.prefilled:seq.prefilled + take]:
+                add(token, seq, False)
+            seq.prefilled += take
+            if seq.prefilled == len(seq.tokens):
+                batch.logits[n - 1] = True
+                outputs.append((seq, n - 1))
+        batch.n_tokens = n
+        result = llama_cpp.llama_decode(self._ctx, batch)
+        if result != 0:
+            for seq in self._running[:]:
+                self._release(seq, RuntimeError(f"llama_decode failed with status {result}"))
+            return
+        self.steps += 1
+        self.batched_tokens += n
+        for seq, index in outputs:
+            start_time = time.perf_counter()
+            token = llama_cpp.llama_sampler_sample(seq.sampler, self._ctx, index)
+            seq.sample_seconds += time.perf_counter() - start_time
+            self._advance(seq, token)
+
+    def _advance(self, seq: BatchedSequence, token: int):
+        seq.next_token = None
+        if llama_cpp.llama_vocab_is_eog(self._vocab, token):
+            self._finish(seq, "stop")
+            return
+        seq.generated += 1
+        seq.text += seq.decoder.decode(self._piece(token))
+        for stop in seq.stop:
+            found = seq.text.find(stop, seq.emitted)
+            if found != -1:
+                seq.text = seq.text[:found]
+                self._finish(seq, "stop")
+                return
+        if (seq.max_tokens is not None and seq.generated >= seq.max_tokens) or seq.pos >= self.n_ctx:
+            self._finish(seq, "length")
+            return
+        # Hold back text that could still turn out to be the start of a stop string
+        end = len(seq.text) - seq.hold
+        if end > seq.emitted:
+            seq.push(seq.text[seq.emitted:end])
+            seq.emitted = end
+        seq.next_token = token
+
+    def _finish(self, seq: BatchedSequence, finish_reason: str):
+        seq.push(seq.text[seq.emitted:], finish_reason)
+        seq.emitted = len(seq.text)
+        self._release(seq)
+
+    def _release(self, seq: BatchedSequence, error: Optional[Exception] = None):
+        """Drop a sequence's KV cells and sampler and end its stream"""
+        if seq in self._running:
+            self._running.remove(seq)
+        llama_cpp.llama_memory_seq_rm(self._memory, seq.seq_id, -1, -1)
+        llama_cpp.llama_sampler_free(seq.sampler)
+        seq.chunks.put(error)
+
+    def _piece(self, token: int) -> bytes:
+        n = llama_cpp.llama_token_to_piece(self._vocab, token, self._piece_buffer, len(self._piece_buffer), 0, False)
+        if n < 0:
+            self._piece_buffer = ctypes.create_string_buffer(-n)
+            n = llama_cpp.llama_token_to_piece(self._vocab, token, self._piece_buffer, len(self._piece_buffer), 0, False)
+        return self._piece_buffer.raw[:n]
+
+def parse_cpulist(text: str) -> set:
+    """Parse a Linux cpulist such as '0-3,8-11' into a set of CPU ids"""
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def worker_cpu_sets(workers: int):
+    """Split the usable CPUs into one set per worker, keeping each set inside a NUMA node"""
+    if hasattr(os, 'sched_getaffinity'):
+        available = os.sched_getaffinity(0)
+    else:
+        available = set(range(os.cpu_count() or 1))
+    nodes = []
+    for cpulist in sorted(Path('/sys/devices/system/node').glob('node[0-9]*/cpulist')):
+        cpus = parse_cpulist(cpulist.read_text()) & available
+        if cpus:
+            nodes.append(sorted(cpus))
+    if len(nodes) < 2:
+        nodes = [sorted(available)]
+
+    # Deal workers out across nodes, then split each node's CPUs between its workers
+    cpu_sets = [None] * workers
+    for node_index, cpus in enumerate(nodes):
+        members = [i for i in range(workers) if i % len(nodes) == node_index]
+        for rank, worker in enumerate(members):
+            share = cpus[rank * len(cpus) // len(members):(rank + 1) * len(cpus) // len(members)]
+            cpu_sets[worker] = set(share or cpus)
+    return cpu_sets
+
+def inference_worker_main(conn, model_path: str, cpus: set, llama_kwargs: Dict[str, Any], engine_factory=None):
+    """Entry point of a pre-forked inference worker process"""
+    try:
+        if cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        llm = (engine_factory or Llama)(
+            model_path=model_path,
+            n_threads=len(cpus) if cpus else os.cpu_count(),
+            use_mmap=True,
+            **llama_kwargs
+        )
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message[0] == 'stop':
+            return
+        if message[0] != 'generate':
+            continue  # a cancel that arrived after its request had finished
+        _, prompt, params = message
+        interrupt = None
+        try:
+            stream = stream_with_usage(llm, prompt, **params)
+            try:
+                for chunk in stream:
+                    conn.send(('chunk', chunk))
+                    if conn.poll():
+                        interrupt = conn.recv()[0]
+                        if interrupt in ('cancel', 'stop'):
+                            break
+            finally:
+                stream.close()
+            conn.send(('done', None))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+        if interrupt == 'stop':
+            return
+
+class InferenceWorker:
+    """Supervisor-side handle for one pre-forked inference process.
+
+    Called like a streaming ``Llama``, so it can be handed to a RequestScheduler
+    as an engine. A worker that dies mid-request fails that request and is
+    restarted before the next one.
+    """
+
+    def __init__(self, index: int, model_path: str, cpus: set, llama_kwargs: Optional[Dict[str, Any]] = None, engine_factory=None):
+        self.index = index
+        self.model_path = model_path
+        self.cpus = cpus
+        self.llama_kwargs = llama_kwargs or {}
+        self.engine_factory = engine_factory
+        self.restarts = 0
+        self.process = None
+        self.conn = None
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """Start the worker process and wait for its model to load"""
+        # Never fork this process directly: restarts happen while the HTTP,
+        # scheduler and monitor threads are running, and a forked child can
+        # inherit a lock one of them holds. The fork server is single-threaded.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=inference_worker_main,
+            args=(child_conn, self.model_path, self.cpus, self.llama_kwargs, self.engine_factory),
+            name=f"easy-edge-worker-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        try:
+            kind, payload = self.conn.recv()
+        except EOFError:
+            kind, payload = 'error', f"exited with code {self.process.exitcode}"
+        if kind != 'ready':
+            self.process.join(timeout=1)
+            raise RuntimeError(f"Worker {self.index} failed to start: {payload}")
+
+    def restart(self):
+        """Replace a dead or wedged worker process"""
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it doesn't"""
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.conn.send(('stop',))
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def __call__(self, prompt: str, stream: bool = True, **params):
+        # Workers always stream; the scheduler assembles the text
+        return self._generate(prompt, params)
+
+    def _generate(self, prompt: str, params: Dict[str, Any]):
+        with self._lock:
+            if not self.alive:
+                self.restart()
+            self.conn.send(('generate', prompt, params))
+            finished = False
+            try:
+                while True:
+                    kind, payload = self.conn.recv()
+                    if kind == 'chunk':
+                        yield payload
+                    elif kind == 'done':
+                        finished = True
+                        return
+                    else:
+                        finished = True
+                        raise RuntimeError(f"Worker {self.index}: {payload}")
+            except (EOFError, OSError):
+                finished = True
+                self.process.join(timeout=1)
+                exitcode = self.process.exitcode
+                self.restart()
+                raise RuntimeError(f"Worker {self.index} died (exit code {exitcode}) and was restarted")
+            finally:
+                if not finished:
+                    # The caller stopped early (cancelled or past deadline): stop the worker and drain
+                    try:
+                        self.conn.send(('cancel',))
+                        while self.conn.recv()[0] == 'chunk':
+                            pass
+                    except (EOFError, OSError):
+                        self.restart()
+
+class WorkerPool:
+    """Supervisor for pre-forked inference workers sharing one mmap'd GGUF.
+
+    Each worker is pinned to its own CPU set (one NUMA node or a slice of one)
+    and runs its own ``Llama`` with one thread per pinned core. Weights come
+    from the same page cache, so only the KV cache is per worker. Dead workers
+    are restarted by a monitor thread. ``engine_factory`` builds the engine in
+    each worker instead of ``Llama``; it must be importable by name.
+    """
+
+    def __init__(self, model_path: str, workers: int, llama_kwargs: Optional[Dict[str, Any]] = None,
+                 check_interval: float = 1.0, engine_factory=None):
+        self.check_interval = check_interval
+        self.workers = [
+            InferenceWorker(i, str(model_path), cpus, llama_kwargs, engine_factory)
+            for i, cpus in enumerate(worker_cpu_sets(workers))
+        ]
+        self._stopped = threading.Event()
+        self._monitor_thread = threading.Thread(target=self._monitor, name="easy-edge-supervisor", daemon=True)
+        self._monitor_thread.start()
+
+    def stats(self):
+        """Pid, pinned CPUs and restart count for each worker"""
+        return [{
+            "index": worker.index,
+            "pid": worker.process.pid if worker.process else None,
+            "alive": worker.alive,
+            "cpus": sorted(worker.cpus) if worker.cpus else None,
+            "restarts": worker.restarts,
+        } for worker in self.workers]
+
+    def shutdown(self):
+        """Stop the monitor and all workers"""
+        self._stopped.set()
+        self._monitor_thread.join()
+        for worker in self.workers:
+            with worker._lock:
+                worker.stop()
+
+    def _monitor(self):
+        while not self._stopped.wait(self.check_interval):
+            for worker in self.workers:
+                # Busy workers are restarted by the request that notices the crash
+                if worker.alive or not worker._lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not worker.alive and not self._stopped.is_set():
+                        exitcode = worker.process.exitcode
+                        worker.restart()
+                        console.print(f"[bold yellow]Worker {worker.index} exited with code {exitcode}; restarted (pid {worker.process.pid})[/bold yellow]")
+                except Exception as e:
+                    console.print(f"[bold red]Failed to restart worker {worker.index}: {e}[/bold red]")
+                finally:
+                    worker._lock.release()
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP front end for a RequestScheduler.
+
+    POST /generate {"prompt", "client_id", "timeout", "max_tokens", "temperature", "top_p", "stop"}
+    POST /cancel {"id"}
+    GET /stats
+    GET /metrics (when instrumentation is enabled)
+    """
+    scheduler = None
+    pool = None
+    batched = None
+    defaults = {}
+
+    def do_GET(self):
+        if self.path == '/stats':
+            stats = self.scheduler.metrics()
+            if self.pool is not None:
+                stats["workers"] = self.pool.stats()
+            if self.batched is not None:
+                stats["batching"] = self.batched.stats()
+            self.send_json(200, stats)
+        elif self.path == '/metrics' and instrumentation.enabled:
+            data = instrumentation.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {"error": "Request body must be JSON"})
+            return
+        if not isinstance(body, dict):
+            self.send_json(400, {"error": "Request body must be a JSON object"})
+            return
+        if self.path == '/generate':
+            self.handle_generate(body)
+        elif self.path == '/cancel':
+            try:
+                request_id = int(body.get('id'))
+            except (TypeError, ValueError):
+                self.send_json(400, {"error": "'id' must be an integer"})
+                return
+            if self.scheduler.cancel(request_id):
+                self.send_json(200, {"cancelled": request_id})
+            else:
+                self.send_json(404, {"error": f"No live request with id {request_id}"})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    @staticmethod
+    def generate_body_error(body: Dict[str, Any]) -> Optional[str]:
+        """Why a /generate body is invalid, or None if it is valid"""
+        def is_number(value):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        prompt = body.get('prompt')
+        if not prompt or not isinstance(prompt, str):
+            return "'prompt' is required and must be a string"
+        if body.get('timeout') is not None and not (is_number(body['timeout']) and body['timeout'] > 0):
+            return "'timeout' must be a positive number of seconds"
+        if 'max_tokens' in body and not (isinstance(body['max_tokens'], int) and not isinstance(body['max_tokens'], bool) and body['max_tokens'] > 0):
+            return "'max_tokens' must be a positive integer"
+        for key in ('temperature', 'top_p'):
+            if key in body and not (is_number(body[key]) and body[key] >= 0):
+                return f"'{key}' must be a non-negative number"
+        stop = body.get('stop')
+        if stop is not None and not isinstance(stop, str) and not (isinstance(stop, Sequence) and all(isinstance(s, str) for s in stop)):
+            return "'stop' must be a string or a list of strings"
+        return None
+
+    def handle_generate(self, body: Dict[str, Any]):
+        error = self.generate_body_error(body)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+        prompt = body['prompt']
+        params = dict(self.defaults)
+        params.update({key: body[key] for key in ('max_tokens', 'temperature', 'top_p', 'stop') if key in body})
+        try:
+            request = self.scheduler.submit(
+                prompt,
+                client_id=str(body.get('client_id') or self.client_address[0]),
+                timeout=body.get('timeout'),
+                **params
+            )
+        except SchedulerFull as e:
+            self.send_json(429, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        try:
+            self.send_json(200, request.wait())
+        except DeadlineExceeded as e:
+            self.send_json(504, {"error": str(e)})
+        except RequestCancelled as e:
+            self.send_json(409, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def touch_pages(mapping) -> float:
+    """Read one byte per page of a mapping; returns the elapsed seconds"""
+    start = time.perf_counter()
+    for offset in range(0, len(mapping), mmap.PAGESIZE):
+        mapping[offset]
+    return time.perf_counter() - start
+
+def prefetch_file(path: Path) -> Dict[str, Any]:
+    """Pull a file into the page cache with readahead and madvise(WILLNEED).
+
+    The pages are touched twice: the first pass pays for whatever was not
+    cached yet, the second shows the cost once everything is resident. The
+    difference is what the next model load no longer spends on page faults.
+    """
+    size = path.stat().st_size
+    with open(path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mapping, 'madvise'):
+            mapping.madvise(mmap.MADV_WILLNEED)
+        cold = touch_pages(mapping)
+        warm = touch_pages(mapping)
+    finally:
+        mapping.close()
+    return {"size": size, "prefetch_time": cold, "warm_time": warm, "saved": max(0.0, cold - warm)}
+
+def lock_file_pages(path: Path) -> int:
+    """Map a file read-only and mlock it; the pages stay resident until this process exits"""
+    if os.name != 'posix':
+        raise OSError("Locking model pages is only supported on Linux and macOS")
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    size = path.stat().st_size
+    # A shared read-only mapping locks the page-cache pages themselves, not private copies
+    with open(path, 'rb') as f:
+        address = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, f.fileno(), 0)
+    if address is None or address == ctypes.c_void_p(-1).value:
+        err = ctypes.get_errno()
+        raise OSError(err, f"mmap failed: {os.strerror(err)}")
+    if libc.mlock(address, size) != 0:
+        err = ctypes.get_errno()
+        libc.munmap(address, size)
+        raise OSError(err, f"mlock failed: {os.strerror(err)} (check 'ulimit -l')")
+    return address
+
+def read_jsonl_documents(path, id_field: str = 'id', text_field: str = 'text'):
+    """Yield (id, text) pairs from a JSONL file, numbering lines without an id.
+
+    Raises ValueError naming the line of a record that is not a JSON object
+    with a string text_field.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from None
+            if not isinstance(record, dict):
+                raise ValueError(f"{path}:{line_number}: expected a JSON object")
+            if not isinstance(record.get(text_field), str):
+                raise ValueError(f"{path}:{line_number}: no '{text_field}' string field")
+            yield record.get(id_field, line_number), record[text_field]
+
+def embed_texts(llm, texts) -> np.ndarray:
+    """Embed a batch of texts as L2-normalised float32 rows"""
+    rows = []
+    for embedding in llm.embed(texts):
+        row = np.asarray(embedding, dtype=np.float32)
+        if row.ndim == 2:
+            row = row.mean(axis=0)  # per-token output from models without a pooling layer
+        rows.append(row)
+    matrix = np.vstack(rows)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_cosine(matrix, query: np.ndarray, k: int, chunk_rows: int = 65536):
+    """Indices and scores of the k rows most similar to query.
+
+    Rows are expected to be L2-normalised, so the dot product is the cosine
+    similarity. The matrix is scanned in chunks, so a memory-mapped index is
+    never fully loaded.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    best_index = np.empty(0, dtype=np.int64)
+    best_score = np.empty(0, dtype=np.float32)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        scores = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32) @ query
+        index = np.arange(start, start + len(scores))
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            scores, index = scores[keep], index[keep]
+        best_index = np.concatenate([best_index, index])
+        best_score = np.concatenate([best_score, scores])
+        if len(best_score) > k:
+            keep = np.argpartition(-best_score, k - 1)[:k]
+            best_index, best_score = best_index[keep], best_score[keep]
+    order = np.argsort(-best_score)
+    return best_index[order], best_score[order]
+
+def read_prompt_file(promptfile):
+    """Return the user prompts from a file of Modelfile MESSAGE lines"""
+    return [message['content'] for message in iter_modelfile_messages(promptfile, role='user')]
+
+def run_load_step(send, prompts, rate: float, duration: float, arrival: str = 'poisson', concurrency: int = 64, seed: int = 0):
+    """Drive send(prompt, client_id) with open-loop arrivals for duration seconds.
+
+    Arrivals are scheduled independently of completions (Poisson or fixed
+    interval), so a slow server builds up a backlog instead of slowing the
+    clients down. Latency is measured from the scheduled arrival time.
+    Arrivals that find all concurrency clients busy are counted as dropped.
+    """
+    if not 0 < rate < math.inf or duration <= 0 or concurrency < 1:
+        raise ValueError("rate and duration must be positive and concurrency at least 1")
+    rng = random.Random(seed)
+    records = []
+    records_lock = threading.Lock()
+    clients = threading.BoundedSemaphore(concurrency)
+    threads = []
+    dropped = 0
+
+    def client(prompt, client_id, arrived_at):
+        record = {"ok": False, "rejected": False, "ttft": None, "latency": None}
+        try:
+            result = send(prompt, client_id)
+            record["latency"] = time.perf_counter() - arrived_at
+            record["ok"] = True
+            if result.get("ttft") is not None:
+                # Shift the server's TTFT by the client-side overhead it did not see
+                overhead = record["latency"] - (result.get("latency") or record["latency"])
+                record["ttft"] = result["ttft"] + max(0.0, overhead)
+        except SchedulerFull:
+            record["rejected"] = True
+        except Exception:
+            pass
+        finally:
+            clients.release()
+        with records_lock:
+            records.append(record)
+
+    start_time = time.perf_counter()
+    next_arrival = start_time
+    sent = 0
+    while next_arrival < start_time + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if clients.acquire(blocking=False):
+            thread = threading.Thread(target=client, args=(prompts[sent % len(prompts)], f"client-{sent % concurrency}", next_arrival), daemon=True)
+            thread.start()
+            threads.append(thread)
+        else:
+            dropped += 1
+        sent += 1
+        next_arrival += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+    for thread in threads:
+        thread.join()
+    return records, dropped, sent, time.perf_counter() - start_time
+
+def summarize_load_step(records, dropped: int, sent: int, elapsed: float, rate: float, slo: float) -> Dict[str, Any]:
+    """Latency percentiles, throughput and goodput under the latency SLO for one load step"""
+    completed = [r for r in records if r["ok"]]
+    latencies = sorted(r["latency"] for r in completed)
+    ttfts = sorted(r["ttft"] for r in completed if r["ttft"] is not None)
+    within_slo = sum(1 for latency in latencies if latency <= slo)
+    return {
+        "rate": rate,
+        "sent": sent,
+        "completed": len(completed),
+        "rejected": sum(1 for r in records if r["rejected"]),
+        "failed": sum(1 for r in records if not r["ok"] and not r["rejected"]),
+        "dropped": dropped,
+        "throughput": len(completed) / elapsed if elapsed else 0.0,
+        "goodput": within_slo / elapsed if elapsed else 0.0,
+        "slo_attainment": within_slo / sent if sent else 0.0,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "ttft_p99": percentile(ttfts, 99),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+    }
+
+def find_saturation_point(steps, slo: float) -> Optional[float]:
+    """Highest offered rate that still completed >=90% of its arrivals with p95 within the SLO.
+
+    Completions are compared with the requests actually sent, not with the
+    nominal rate: Poisson arrival counts vary from run to run, and throughput
+    is diluted by the time spent draining requests still in flight.
+    """
+    saturation = None
+    for step in sorted(steps, key=lambda step: step["rate"]):
+        if step["completed"] < 0.9 * step["sent"] or step["latency_p95"] > slo:
+            break
+        saturation = step["rate"]
+    return saturation
+
+def compare_load_baseline(steps, baseline_steps, threshold: float):
+    """Describe every metric that regressed by more than threshold against a baseline"""
+    regressions = []
+    baseline_by_rate = {step["rate"]: step for step in baseline_steps}
+    for step in steps:
+        base = baseline_by_rate.get(step["rate"])
+        if base is None:
+            continue
+        for key in ("ttft_p95", "latency_p95", "latency_p99"):
+            if base[key] > 0 and step[key] > base[key] * (1 + threshold):
+                regressions.append(f"{key} at {step['rate']:g} req/s: {base[key]:.3f}s -> {step[key]:.3f}s")
+        if base["goodput"] > 0 and step["goodput"] < base["goodput"] * (1 - threshold):
+            regressions.append(f"goodput at {step['rate']:g} req/s: {base['goodput']:.2f} -> {step['goodput']:.2f} req/s")
+    return regressions
+
+def model_quantization(info: Dict[str, Any]) -> str:
+    """Quantization type (e.g. Q4_K_M) parsed from a registry entry's file name"""
+    filename = info.get("original_filename") or info.get("filename", "")
+    m = re.search(r'(?<![A-Za-z0-9])(I?Q\d+(?:_[A-Za-z0-9]+)*|BF16|F16|F32)(?![A-Za-z0-9])', filename, re.IGNORECASE)
+    return m.group(1).upper() if m else "unknown"
+
+def synthetic_prompt_tokens(llm, n_tokens: int, seed: int = 0):
+    """Exactly n_tokens prompt token ids cut from filler text (varied by seed to defeat prefix caching)"""
+    filler = f"Sample {seed}: The quick brown fox jumps over the lazy dog while the engineers measure throughput. "
+    tokens = llm.tokenize(filler.encode('utf-8'), add_bos=False)
+    repeats = n_tokens // len(tokens) + 1
+    return [llm.token_bos()] + (tokens * repeats)[:n_tokens - 1]
+
+def run_matrix_cell(llm, prompt_tokens, gen_tokens: int) -> Dict[str, float]:
+    """Time one completion of exactly gen_tokens tokens (EOS suppressed) from a fresh context"""
+    llm.reset()
+    start_time = time.perf_counter()
+    first_token = None
+    generated = 0
+    for _ in llm(prompt_tokens, stream=True, max_tokens=gen_tokens, temperature=0.0, stop=[],
+                 logit_bias={llm.token_eos(): float('-inf')}):
+        if first_token is None:
+            first_token = time.perf_counter() - start_time
+        generated += 1
+    total = time.perf_counter() - start_time
+    first_token = first_token if first_token is not None else total
+    decode_time = total - first_token
+    return {
+        "ttft_s": first_token,
+        "total_s": total,
+        "generated_tokens": generated,
+        "prefill_tps": len(prompt_tokens) / first_token if first_token > 0 else 0.0,
+        "decode_tps": (generated - 1) / decode_time if generated > 1 and decode_time > 0 else 0.0,
+    }
+
+class MemorySampler:
+    """Samples this process's memory in a background thread while a request runs.
+
+    RSS is split into its file-backed share (mmap'd model weights, reclaimable
+    page cache) and its anonymous share (KV cache, compute buffers, Python).
+    These come from /proc/<pid>/statm and are cheap to read every interval.
+    USS and PSS need /proc/<pid>/smaps_rollup, which walks the page tables of
+    the whole weight mapping, so they are read on entry and exit and at most
+    every full_interval in between (Linux only; None elsewhere). The CPU time
+    the sampling thread spends is kept in ``overhead``.
+    """
+    FIELDS = ("rss", "uss", "pss", "file", "anon")
+
+    def __init__(self, interval: float = 0.05, full_interval: float = 1.0):
+        if interval <= 0 or full_interval <= 0:
+            raise ValueError("Memory sampling intervals must be positive")
+        self.interval = interval
+        self.full_interval = full_interval
+        self.process = psutil.Process(os.getpid())
+        self.peak = dict.fromkeys(self.FIELDS)
+        self.samples = 0
+        self.full_samples = 0
+        self.overhead = 0.0
+        self._full_info = True
+        self._last_full = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._stop.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="easy-edge-memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            start_time = time.thread_time()
+            self.sample(full=time.monotonic() - self._last_full >= self.full_interval)
+            self.overhead += time.thread_time() - start_time
+
+    def sample(self, full: bool = True):
+        """Take one sample and update the peaks; full=False skips USS and PSS"""
+        info = None
+        if full and self._full_info:
+            try:
+                info = self.process.memory_full_info()
+                self._last_full = time.monotonic()
+                self.full_samples += 1
+            except (psutil.AccessDenied, NotImplementedError):
+                self._full_info = False
+        if info is None:
+            info = self.process.memory_info()
+        shared = getattr(info, "shared", None)  # Linux: RssFile + RssShmem
+        values = {
+            "rss": info.rss,
+            "uss": getattr(info, "uss", None),
+            "pss": getattr(info, "pss", None),
+            "file": shared,
+            "anon": info.rss - shared if shared is not None else None,
+        }
+        for key, value in values.items():
+            if value is not None and (self.peak[key] is None or value > self.peak[key]):
+                self.peak[key] = value
+        self.samples += 1
+
+def estimate_context_memory(llm) -> Dict[str, Optional[int]]:
+    """KV-cache and compute-buffer bytes implied by the model shape and n_ctx / n_ubatch.
+
+    The KV cache is exact for the default f16 cache: 2 bytes x layers x n_ctx x
+    KV heads x (key + value head size). The compute buffer is an estimate of
+    llama.cpp's f32 graph allocation for one micro-batch: the larger of the
+    logits and the attention scores over the full context, plus hidden states.
+    """
+    meta = getattr(llm, "metadata", None) or {}
+    arch = meta.get("general.architecture", "llama")
+    try:
+        n_layer = int(meta[f"{arch}.block_count"])
+        n_embd = int(meta[f"{arch}.embedding_length"])
+        n_head = int(meta[f"{arch}.attention.head_count"])
+    except (KeyError, ValueError):
+        return {"kv_cache": None, "compute_buffer": None}
+    n_head_kv = int(meta.get(f"{arch}.attention.head_count_kv", n_head))
+    key_length = int(meta.get(f"{arch}.attention.key_length", n_embd // n_head))
+    value_length = int(meta.get(f"{arch}.attention.value_length", key_length))
+    n_ctx = llm.n_ctx()
+    n_ubatch = getattr(getattr(llm, "context_params", None), "n_ubatch", None) or min(llm.n_batch, 512)
+    kv_cache = 2 * n_layer * n_ctx * n_head_kv * (key_length + value_length)
+    compute_buffer = 4 * n_ubatch * (max(llm.n_vocab(), n_head * n_ctx) + 4 * n_embd)
+    return {"kv_cache": kv_cache, "compute_buffer": compute_buffer}
+
+MODELFILE_INSTRUCTIONS = ('FROM', 'PARAMETER', 'SYSTEM', 'MESSAGE', 'HF_TOKEN', 'TEMPLATE')
+MODELFILE_QUOTES = ('"""', "'''")
+
+def iter_modelfile(modelfile_path):
+    """Yield (instruction, value) pairs from a Modelfile one at a time.
+
+    MESSAGE values are (role, content) tuples; all others are strings. A value
+    opened with triple quotes runs until the matching closing quotes, so
+    SYSTEM, TEMPLATE and MESSAGE blocks may span several lines. Only the
+    current instruction is held in memory. Raises ValueError, naming the line
+    that opened it, if a quoted block is still open at the end of the file.
+    """
+    with open(modelfile_path, 'r', encoding='utf-8', buffering=1 << 20) as f:
+        lines = enumerate(f, 1)
+
+        def read_value(text, opened_at):
+            text = text.strip()
+            quote = text[:3]
+            if quote not in MODELFILE_QUOTES:
+                return text
+            body = text[3:]
+            if body.endswith(quote):
+                return body[:-3]
+            parts = [body] if body else []
+            for _, line in lines:
+                line = line.rstrip('\r\n')
+                if line.rstrip().endswith(quote):
+                    closing = line.rstrip()[:-3]
+                    if closing:
+                        parts.append(closing)
+                    return '\n'.join(parts)
+                parts.append(line)
+            raise ValueError(f"{modelfile_path}:{opened_at}: {quote} block is never closed")
+
+        for line_number, line in lines:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            instruction, _, rest = line.partition(' ')
+            if instruction == 'MESSAGE':
+                role, _, content = rest.partition(' ')
+                if role and content.strip():
+                    yield 'MESSAGE', (role, read_value(content, line_number))
+            elif instruction in MODELFILE_INSTRUCTIONS and rest:
+                yield instruction, read_value(rest, line_number)
+
+def iter_modelfile_messages(modelfile_path, role: Optional[str] = None):
+    """Yield MESSAGE entries as {'role', 'content'} dicts, optionally only one role"""
+    role = role.lower() if role else None
+    for instruction, value in iter_modelfile(modelfile_path):
+        if instruction == 'MESSAGE' and (role is None or value[0].lower() == role):
+            yield {'role': value[0], 'content': value[1]}
+
+def iter_training_pairs(modelfile_path):
+    """Yield (instruction, output) for each user/assistant MESSAGE pair, taken two at a time"""
+    pending = None
+    for message in iter_modelfile_messages(modelfile_path):
+        if pending is None:
+            pending = message
+            continue
+        if pending['role'] == 'user' and message['role'] == 'assistant':
+            yield pending['content'], message['content']
+        pending = None
+
+def parse_modelfile(modelfile_path, messages: bool = True):
+    """Parse a Modelfile and return a dict of its instructions.
+
+    With messages=False the MESSAGE entries are skipped rather than collected;
+    use iter_modelfile_messages to stream them instead.
+    """
     config = {
         'FROM': None,
         'PARAMETER': {},
@@ -280,49 +2193,34 @@ def parse_modelfile(modelfile_path):
         'HF_TOKEN': None,
         'TEMPLATE': None
     }
-    with open(modelfile_path, 'r') as f:
-        template_lines = []
-        in_template = False
-        for line in f:
-            line = line.rstrip('\n')
-            if not line or line.strip().startswith('#'):
-                continue
-            if line.startswith('FROM '):
-                config['FROM'] = line[len('FROM '):].strip()
-            elif line.startswith('PARAMETER '):
-                param = line[len('PARAMETER '):].strip()
-                key, value = param.split(' ', 1)
-                config['PARAMETER'][key] = value
-            elif line.startswith('SYSTEM '):
-                config['SYSTEM'] = line[len('SYSTEM '):].strip()
-            elif line.startswith('MESSAGE '):
-                m = re.match(r'MESSAGE (\w+) (.+)', line)
-                if m:
-                    role, content = m.groups()
-                    config['MESSAGES'].append({'role': role, 'content': content})
-            elif line.startswith('HF_TOKEN '):
-                config['HF_TOKEN'] = line[len('HF_TOKEN '):].strip()
-            elif line.startswith('TEMPLATE '):
-                in_template = True
-                template_lines = [line[len('TEMPLATE '):].strip()]
-            elif in_template:
-                if line.strip() == '"""' or line.strip() == "'''":
-                    in_template = False
-                    config['TEMPLATE'] = '\n'.join(template_lines)
-                else:
-                    template_lines.append(line)
-        if in_template:
-            config['TEMPLATE'] = '\n'.join(template_lines)
+    for instruction, value in iter_modelfile(modelfile_path):
+        if instruction == 'MESSAGE':
+            if messages:
+                config['MESSAGES'].append({'role': value[0], 'content': value[1]})
+        elif instruction == 'PARAMETER':
+            key, _, param = value.partition(' ')
+            config['PARAMETER'][key] = param.strip()
+        else:
+            config[instruction] = value
     return config
 
 @click.group()
 @click.option('--models-dir', default='models', help='Directory to store models')
+@click.option('--metrics', is_flag=True, help='Record inference metrics (exposed at /metrics by serve)')
+@click.option('--metrics-port', type=int, help='Record inference metrics and serve them for Prometheus on this port')
+@click.option('--metrics-file', type=click.Path(), help='Record inference metrics and append them to this file as OTLP/JSON')
 @click.version_option(version='1.0.0', prog_name='easy-edge')
 @click.pass_context
-def cli(ctx, models_dir):
+def cli(ctx, models_dir, metrics, metrics_port, metrics_file):
     """Easy Edge - Run LLMs locally like Ollama"""
     ctx.ensure_object(dict)
     ctx.obj['easy_edge'] = EasyEdge(models_dir)
+    if metrics or metrics_port or metrics_file:
+        instrumentation.enable()
+    if metrics_port:
+        instrumentation.serve_prometheus(port=metrics_port)
+    if metrics_file:
+        instrumentation.start_otlp_file_export(metrics_file)
 
 @cli.command()
 @click.option('--url', help='Hugging Face URL to download the model')
@@ -377,6 +2275,8 @@ def remove(ctx, model_name):
         console.print(f"✅ Removed model file: {model_path}")
     
     del easy_edge.config["models"][model_name]
+    if model_name in easy_edge.config.get("warm_on_boot", []):
+        easy_edge.config["warm_on_boot"].remove(model_name)
     easy_edge.save_config()
     console.print(f"✅ Removed model '{model_name}' from configuration")
 
@@ -391,7 +2291,11 @@ def remove(ctx, model_name):
 def finetune(ctx, modelfile, output, name, epochs, batch_size, learning_rate):
     """Finetune a model using a Modelfile (Ollama-style, Hugging Face Trainer, GGUF conversion)."""
     console.print(f"[bold green]Parsing Modelfile:[/bold green] {modelfile}")
-    config = parse_modelfile(modelfile)
+    try:
+        config = parse_modelfile(modelfile, messages=False)
+    except ValueError as e:
+        console.print(f"❌ {e}")
+        return
     # Helper to extract and convert parameters (must be defined before use)
     def get_param(key, default, typ):
         val = config['PARAMETER'].get(key, default)
@@ -405,7 +2309,6 @@ def finetune(ctx, modelfile, output, name, epochs, batch_size, learning_rate):
     name = name if name else None
     model_name = name if name else Path(output).stem
     repo_id = config['FROM']
-    messages = config['MESSAGES']
     hf_token = config.get('HF_TOKEN')
     # LoRA/PEFT parameters
     lora = get_param('lora', False, bool)
@@ -470,28 +2373,18 @@ def finetune(ctx, modelfile, output, name, epochs, batch_size, learning_rate):
         return
     # 2. Create dataset from MESSAGE blocks
     console.print("[bold blue]Preparing dataset from Modelfile messages...[/bold blue]")
-    data = []
-    for i in range(0, len(messages), 2):
-        if i+1 < len(messages) and messages[i]['role'] == 'user' and messages[i+1]['role'] == 'assistant':
-            data.append({
-                'instruction': messages[i]['content'],
-                'output': messages[i+1]['content'],
-                'user_message': messages[i],
-                'assistant_message': messages[i+1]
-            })
-    if not data:
+    if next(iter_training_pairs(modelfile), None) is None:
         console.print("[bold red]No valid user/assistant message pairs found in Modelfile![/bold red]")
         return
     # 2b. Format dataset using tokenizer.apply_chat_template if available, else use template
-    formatted_data = []
     if hasattr(tokenizer, 'apply_chat_template'):
         console.print("[bold blue]Using tokenizer.apply_chat_template for prompt formatting...[/bold blue]")
-        for ex in data:
+        def format_example(instruction, output):
             chat_messages = [
-                {"role": "user", "content": ex['instruction']},
-                {"role": "assistant", "content": ex['output']}
+                {"role": "user", "content": instruction},
+                {"role": "assistant", "content": output}
             ]
-            formatted_data.append({'text': tokenizer.apply_chat_template(chat_messages, tokenize=False)})
+            return tokenizer.apply_chat_template(chat_messages, tokenize=False)
     else:
         template = config.get('TEMPLATE')
         system_prompt = config.get('SYSTEM')
@@ -506,9 +2399,15 @@ def finetune(ctx, modelfile, output, name, epochs, batch_size, learning_rate):
             result = result.replace('{{ .Prompt }}', prompt)
             result = result.replace('{{ .Response }}', response)
             return result
-        for ex in data:
-            formatted_data.append({'text': render_template(system_prompt, ex['instruction'], ex['output'], template)})
-    dataset = Dataset.from_list(formatted_data)
+        def format_example(instruction, output):
+            return render_template(system_prompt, instruction, output, template)
+    def formatted_examples():
+        for instruction, output in iter_training_pairs(modelfile):
+            yield {'text': format_example(instruction, output)}
+    # Stream pairs straight from the Modelfile into an Arrow cache on disk
+    dataset_dir = tempfile.mkdtemp(prefix='easy_edge_dataset_')
+    atexit.register(shutil.rmtree, dataset_dir, True)
+    dataset = Dataset.from_generator(formatted_examples, cache_dir=dataset_dir)
     # 3. Tokenize dataset
     # Use max_length from PARAMETER if present, else default to 2048
     try:
@@ -595,10 +2494,15 @@ def finetune(ctx, modelfile, output, name, epochs, batch_size, learning_rate):
 @click.option('--promptfile', type=click.Path(exists=True), help='Path to a file with prompts (Modelfile MESSAGE format)')
 @click.option('--repeat', default=1, type=int, help='Number of times to repeat the benchmark')
 @click.option('--model', 'model_name', required=True, help='Model name to benchmark')
+@click.option('--mem-interval', default=0.05, type=float, help='Seconds between RSS samples during each request; USS/PSS are read at most once a second (default: 0.05)')
 @click.pass_context
-def benchmark(ctx, prompt, promptfile, repeat, model_name):
+def benchmark(ctx, prompt, promptfile, repeat, model_name, mem_interval):
     """Benchmark model speed (tokens/sec, latency) and memory usage."""
 
+    if mem_interval <= 0:
+        console.print("[bold red]--mem-interval must be positive.[/bold red]")
+        return
+
     easy_edge = ctx.obj['easy_edge']
     model_path = easy_edge.get_model_path(model_name)
     if not model_path:
@@ -608,11 +2512,11 @@ def benchmark(ctx, prompt, promptfile, repeat, model_name):
     # Loading the prompts
     prompts = []
     if promptfile:
-        with open(promptfile, 'r', encoding='utf-8') as f:
-            for line in f:
-                m = re.match(r'^MESSAGE (\w+) (.+)', line.strip())
-                if m and m.group(1).lower() == 'user':
-                    prompts.append(m.group(2))
+        try:
+            prompts = read_prompt_file(promptfile)
+        except ValueError as e:
+            console.print(f"❌ {e}")
+            return
         if not prompts:
             console.print(f"[bold red]No valid user MESSAGE lines found in {promptfile}![/bold red]")
             return
@@ -624,36 +2528,36 @@ def benchmark(ctx, prompt, promptfile, repeat, model_name):
 
     # Preparing the model
     console.print(f"[bold green]Loading model {model_name}...[/bold green]")
-    llm = Llama(
-        model_path=str(model_path),
-        n_ctx=2048,
-        n_threads=os.cpu_count()
-    )
+    llm = easy_edge.load_llama(model_name)
 
     # Benchmark loop
     total_tokens = 0
     total_time = 0.0
     first_token_times = []
     all_latencies = []
-    peak_mem = 0
+    peak = dict.fromkeys(MemorySampler.FIELDS)
+    sampler_overhead = 0.0
     completion_tokens_count = 0
 
+    def mb(value):
+        return f"{value / (1024*1024):.2f}" if value is not None else "n/a"
+
     for i in range(repeat):
         print("Iteration", i+1)
         for prompt_text in prompts:
-            process = psutil.Process(os.getpid())
-            mem_before = process.memory_info().rss
-            start_time = time.perf_counter()
-            response = llm(
-                prompt_text,
-                max_tokens=easy_edge.config["settings"]["max_tokens"],
-                temperature=easy_edge.config["settings"]["temperature"],
-                top_p=easy_edge.config["settings"]["top_p"],
-                stop=["User:", "\n\n"]
-            )
-            end_time = time.perf_counter()
-            mem_after = process.memory_info().rss
-            peak_mem = max(peak_mem, mem_after)
+            with MemorySampler(mem_interval) as sampler:
+                start_time = time.perf_counter()
+                response = llm(
+                    prompt_text,
+                    max_tokens=easy_edge.config["settings"]["max_tokens"],
+                    temperature=easy_edge.config["settings"]["temperature"],
+                    top_p=easy_edge.config["settings"]["top_p"],
+                    stop=["User:", "\n\n"]
+                )
+                end_time = time.perf_counter()
+            for key, value in sampler.peak.items():
+                if value is not None and (peak[key] is None or value > peak[key]):
+                    peak[key] = value
             latency = end_time - start_time
             all_latencies.append(latency)
             usage = response.get("usage", {})
@@ -667,7 +2571,12 @@ def benchmark(ctx, prompt, promptfile, repeat, model_name):
             print("Total Tokens:", prompt_tokens + completion_tokens)
             print("Prompt Tokens:", prompt_tokens)
             print(f"Throughput speed: {throughput_speed:.2f} tokens/s")
-            print(f"Peak memory: {peak_mem / (1024*1024):.2f} MB")
+            print(f"Peak memory: {mb(sampler.peak['rss'])} MB RSS "
+                  f"({mb(sampler.peak['file'])} MB file-backed, {mb(sampler.peak['anon'])} MB anonymous), "
+                  f"USS {mb(sampler.peak['uss'])} MB, PSS {mb(sampler.peak['pss'])} MB, {sampler.samples} samples")
+            print(f"Memory sampler CPU: {sampler.overhead * 1000:.1f} ms "
+                  f"({sampler.overhead / latency * 100 if latency > 0 else 0:.2f}% of the request)")
+            sampler_overhead += sampler.overhead
 
             print("-------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
     total_runs = repeat * len(prompts)
@@ -676,6 +2585,7 @@ def benchmark(ctx, prompt, promptfile, repeat, model_name):
     avg_first_token = sum(first_token_times) / total_runs if total_runs else 0
     tokens_per_sec = total_tokens / total_time if total_time > 0 else 0
     throughput_speed = completion_tokens_count / total_time if total_time > 0 else 0  # requests per second
+    context_memory = estimate_context_memory(llm)
     table = Table(title="Benchmark Results", box=box.SIMPLE)
     table.add_column("Metric", style="bold")
     table.add_column("Value")
@@ -683,8 +2593,484 @@ def benchmark(ctx, prompt, promptfile, repeat, model_name):
     table.add_row("Avg time to first token (s)", f"{avg_first_token:.3f}")
     table.add_row("Tokens/sec", f"{tokens_per_sec:.2f}")
     table.add_row("Throughput speed (req/s)", f"{throughput_speed:.2f}")
-    table.add_row("Peak memory (MB)", f"{peak_mem / (1024*1024):.2f}")
+    table.add_row("Peak memory (MB)", mb(peak["rss"]))
+    table.add_row("  File-backed / mmap'd weights (MB)", mb(peak["file"]))
+    table.add_row("  Anonymous (MB)", mb(peak["anon"]))
+    table.add_row("Peak USS (MB)", mb(peak["uss"]))
+    table.add_row("Peak PSS (MB)", mb(peak["pss"]))
+    table.add_row("Memory sampler CPU (s)", f"{sampler_overhead:.3f} ({sampler_overhead / total_time * 100 if total_time > 0 else 0:.2f}% of request time)")
+    table.add_row(f"KV cache at n_ctx={llm.n_ctx()} (MB)", mb(context_memory["kv_cache"]))
+    table.add_row("Compute buffer, estimated (MB)", mb(context_memory["compute_buffer"]))
     console.print(table)
 
+@cli.command()
+@click.argument('model_names', nargs=-1)
+@click.option('--lock', is_flag=True, help='mlock the model files and keep running so they stay resident')
+@click.option('--save', is_flag=True, help='Add the given models to the warm-on-boot list')
+@click.option('--forget', is_flag=True, help='Remove the given models from the warm-on-boot list')
+@click.pass_context
+def warm(ctx, model_names, lock, save, forget):
+    """Prefetch models into the page cache (the warm-on-boot list when no models are given)."""
+    easy_edge = ctx.obj['easy_edge']
+    boot_list = easy_edge.config.setdefault("warm_on_boot", [])
+
+    if save and forget:
+        console.print("❌ Use either --save or --forget, not both")
+        return
+    if forget:
+        for model_name in model_names:
+            if model_name in boot_list:
+                boot_list.remove(model_name)
+                console.print(f"✅ Removed '{model_name}' from the warm-on-boot list")
+        easy_edge.save_config()
+        return
+    if save:
+        missing = [name for name in model_names if name not in easy_edge.config["models"]]
+        if missing:
+            console.print(f"❌ Model(s) not found: {', '.join(missing)}")
+            return
+        for model_name in model_names:
+            if model_name not in boot_list:
+                boot_list.append(model_name)
+                console.print(f"✅ Added '{model_name}' to the warm-on-boot list")
+        easy_edge.save_config()
+
+    if not model_names:
+        model_names = boot_list
+        if not model_names:
+            console.print("No models to warm. Pass model names or add some with 'easy-edge warm <model> --save'.")
+            return
+
+    table = Table(title="Warm-up Results", box=box.SIMPLE)
+    table.add_column("Model", style="bold")
+    table.add_column("Size (MB)")
+    table.add_column("Prefetch (s)")
+    table.add_column("Warm read (s)")
+    table.add_column("Load time saved (s)")
+    table.add_column("Locked")
+    for model_name in model_names:
+        model_path = easy_edge.get_model_path(model_name)
+        if not model_path:
+            console.print(f"❌ Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+            continue
+        with console.status(f"Prefetching {model_name}..."):
+            result = prefetch_file(model_path)
+        locked = "no"
+        if lock:
+            try:
+                lock_file_pages(model_path)
+                locked = "yes"
+            except OSError as e:
+                console.print(f"[bold yellow]Could not lock {model_name}: {e}[/bold yellow]")
+        table.add_row(
+            model_name,
+            f"{result['size'] / (1024*1024):.1f}",
+            f"{result['prefetch_time']:.3f}",
+            f"{result['warm_time']:.3f}",
+            f"{result['saved']:.3f}",
+            locked
+        )
+    console.print(table)
+
+    if lock:
+        console.print("Holding model pages locked in memory. Press Ctrl+C to release them.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            console.print("\nGoodbye!")
+
+@cli.command()
+@click.option('--model', 'model_name', required=True, help='Model name used to compute embeddings')
+@click.option('--input', 'input_path', required=True, type=click.Path(exists=True), help='JSONL file with one {"id": ..., "text": ...} object per line')
+@click.option('--output', required=False, type=click.Path(), help='Output prefix for <prefix>.npy and <prefix>.ids.jsonl (default: input path without extension)')
+@click.option('--batch-size', default=32, type=int, help='Texts embedded per call (default: 32)')
+@click.option('--dtype', default='float32', type=click.Choice(['float32', 'float16']), help='Storage type of the matrix (default: float32)')
+@click.option('--id-field', default='id', help='JSON field holding the document id (default: id)')
+@click.option('--text-field', default='text', help='JSON field holding the document text (default: text)')
+@click.pass_context
+def embed(ctx, model_name, input_path, output, batch_size, dtype, id_field, text_field):
+    """Compute embeddings for a JSONL file into a memory-mapped matrix."""
+    easy_edge = ctx.obj['easy_edge']
+    if batch_size < 1:
+        console.print("[bold red]--batch-size must be at least 1.[/bold red]")
+        return
+    if not easy_edge.get_model_path(model_name):
+        console.print(f"❌ Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        return
+    prefix = Path(output) if output else Path(input_path).with_suffix('')
+    matrix_path = prefix.with_name(prefix.name + '.npy')
+    ids_path = prefix.with_name(prefix.name + '.ids.jsonl')
+
+    try:
+        total = sum(1 for _ in read_jsonl_documents(input_path, id_field, text_field))
+    except ValueError as e:
+        console.print(f"❌ {e}")
+        return
+    if not total:
+        console.print(f"[bold red]No documents found in {input_path}![/bold red]")
+        return
+
+    console.print(f"[bold green]Loading model {model_name}...[/bold green]")
+    llm = easy_edge.load_llama(model_name, embedding=True)
+    matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=dtype, shape=(total, llm.n_embd()))
+
+    start_time = time.perf_counter()
+    documents = read_jsonl_documents(input_path, id_field, text_field)
+    row = 0
+    with open(ids_path, 'w', encoding='utf-8') as ids_file, tqdm(total=total, desc="Embedding", unit="doc") as progress:
+        while row < total:
+            batch = [document for _, document in zip(range(batch_size), documents)]
+            matrix[row:row + len(batch)] = embed_texts(llm, [text for _, text in batch])
+            for doc_id, _ in batch:
+                ids_file.write(json.dumps(doc_id) + '\n')
+            row += len(batch)
+            progress.update(len(batch))
+    matrix.flush()
+    elapsed = time.perf_counter() - start_time
+    console.print(f"✅ Embedded {total} documents in {elapsed:.2f}s ({total / elapsed:.1f} docs/s)")
+    console.print(f"   Matrix: {matrix_path} ({total} x {matrix.shape[1]}, {dtype})")
+    console.print(f"   IDs:    {ids_path}")
+
+@cli.command()
+@click.option('--model', 'model_name', required=True, help='Model name used to build the index')
+@click.option('--index', 'index_prefix', required=True, type=click.Path(), help='Prefix given to (or derived by) embed')
+@click.option('--query', '-q', required=True, help='Text to search for')
+@click.option('--top-k', '-k', default=5, type=int, help='Number of results (default: 5)')
+@click.pass_context
+def search(ctx, model_name, index_prefix, query, top_k):
+    """Cosine-similarity search over an embedding matrix built by embed."""
+    easy_edge = ctx.obj['easy_edge']
+    prefix = Path(index_prefix)
+    if prefix.suffix == '.npy':
+        prefix = prefix.with_suffix('')
+    matrix_path = prefix.with_name(prefix.name + '.npy')
+    ids_path = prefix.with_name(prefix.name + '.ids.jsonl')
+    if not matrix_path.exists() or not ids_path.exists():
+        console.print(f"❌ Index not found: expected {matrix_path} and {ids_path}")
+        return
+    if not easy_edge.get_model_path(model_name):
+        console.print(f"❌ Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        return
+
+    matrix = np.load(matrix_path, mmap_mode='r')
+    llm = easy_edge.load_llama(model_name, embedding=True)
+    if llm.n_embd() != matrix.shape[1]:
+        console.print(f"❌ Model '{model_name}' produces {llm.n_embd()}-d embeddings but the index is {matrix.shape[1]}-d")
+        return
+    start_time = time.perf_counter()
+    query_vector = embed_texts(llm, [query])[0]
+    rows, scores = top_k_cosine(matrix, query_vector, top_k)
+    elapsed = time.perf_counter() - start_time
+
+    # Only the matching lines of the id sidecar are decoded
+    wanted = {int(row): rank for rank, row in enumerate(rows)}
+    ids = [None] * len(rows)
+    with open(ids_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if line_number in wanted:
+                ids[wanted[line_number]] = json.loads(line)
+
+    table = Table(title=f"Top {len(rows)} of {matrix.shape[0]} ({elapsed * 1000:.1f} ms)", box=box.SIMPLE)
+    table.add_column("Rank", style="bold")
+    table.add_column("ID")
+    table.add_column("Score")
+    for rank, (doc_id, score) in enumerate(zip(ids, scores), 1):
+        table.add_row(str(rank), str(doc_id), f"{score:.4f}")
+    console.print(table)
+
+def parse_int_list(value: str):
+    """Parse a comma-separated list of integers such as '32,512,2048'"""
+    return [int(part) for part in value.split(',') if part.strip()]
+
+@cli.command(name='benchmark-matrix')
+@click.option('--models', default=None, help='Comma-separated model names (default: all installed models)')
+@click.option('--quant', default=None, help='Only models with these quantizations, e.g. Q4_0,Q8_0')
+@click.option('--threads', default=None, help='Comma-separated n_threads values (default: CPU count)')
+@click.option('--batch', default='512', help='Comma-separated n_batch values (default: 512)')
+@click.option('--ctx', 'contexts', default='4096', help='Comma-separated n_ctx values (default: 4096)')
+@click.option('--prompt-tokens', default='32,512,2048', help='Prompt length buckets in tokens (default: 32,512,2048)')
+@click.option('--gen-tokens', default='32,128', help='Generation lengths in tokens (default: 32,128)')
+@click.option('--repeat', default=1, type=int, help='Runs per cell; the median is reported (default: 1)')
+@click.option('--output', default='benchmark_matrix.csv', type=click.Path(), help='Results file, .csv or .json (default: benchmark_matrix.csv)')
+@click.pass_context
+def benchmark_matrix(ctx, models, quant, threads, batch, contexts, prompt_tokens, gen_tokens, repeat, output):
+    """Sweep models, quantizations, threads, batch and context sizes over prompt-length buckets."""
+    easy_edge = ctx.obj['easy_edge']
+    try:
+        thread_values = parse_int_list(threads) if threads else [os.cpu_count()]
+        batch_values = parse_int_list(batch)
+        ctx_values = parse_int_list(contexts)
+        prompt_values = parse_int_list(prompt_tokens)
+        gen_values = parse_int_list(gen_tokens)
+    except ValueError as e:
+        console.print(f"[bold red]Invalid list value: {e}[/bold red]")
+        return
+    if min(thread_values + batch_values + ctx_values + prompt_values + gen_values, default=0) < 1:
+        console.print("[bold red]--threads, --batch, --ctx, --prompt-tokens and --gen-tokens need positive values.[/bold red]")
+        return
+    if repeat < 1:
+        console.print("[bold red]--repeat must be at least 1.[/bold red]")
+        return
+
+    model_names = [name.strip() for name in models.split(',')] if models else sorted(easy_edge.config["models"])
+    if quant:
+        wanted = {q.strip().upper() for q in quant.split(',')}
+        model_names = [name for name in model_names
+                       if model_quantization(easy_edge.config["models"].get(name, {})) in wanted]
+    model_names = [name for name in model_names if easy_edge.get_model_path(name)]
+    if not model_names:
+        console.print("❌ No installed models match. Use 'easy-edge list' to see what is installed.")
+        return
+
+    for n_ctx in ctx_values:
+        skipped = [f"{p}+{g}" for p, g in itertools.product(prompt_values, gen_values) if p + g > n_ctx]
+        if skipped:
+            console.print(f"[bold yellow]Skipping cells that do not fit in ctx={n_ctx} (prompt+gen tokens): {', '.join(skipped)}[/bold yellow]")
+
+    rows = []
+    try:
+        for model_name, n_threads, n_batch, n_ctx in itertools.product(model_names, thread_values, batch_values, ctx_values):
+            cells = [(p, g) for p, g in itertools.product(prompt_values, gen_values) if p + g <= n_ctx]
+            if not cells:
+                continue
+            console.print(f"[bold green]Loading {model_name} (threads={n_threads}, batch={n_batch}, ctx={n_ctx})...[/bold green]")
+            load_start = time.perf_counter()
+            llm = easy_edge.load_llama(model_name, n_ctx=n_ctx, n_threads=n_threads, n_batch=n_batch, verbose=False)
+            load_time = time.perf_counter() - load_start
+            for p, g in cells:
+                runs = [run_matrix_cell(llm, synthetic_prompt_tokens(llm, p, seed=i), g) for i in range(repeat)]
+                median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+                row = {
+                    "model": model_name,
+                    "quant": model_quantization(easy_edge.config["models"][model_name]),
+                    "n_threads": n_threads,
+                    "n_batch": n_batch,
+                    "n_ctx": n_ctx,
+                    "prompt_tokens": p,
+                    "gen_tokens": g,
+                    "repeat": repeat,
+                    "load_s": round(load_time, 4),
+                    **{key: round(value, 4) for key, value in median.items()},
+                    "rss_mb": round(psutil.Process(os.getpid()).memory_info().rss / (1024*1024), 1),
+                }
+                rows.append(row)
+                console.print(f"  prompt={p:>5} gen={g:>4}  ttft={row['ttft_s']:.3f}s  "
+                              f"prefill={row['prefill_tps']:.1f} tok/s  decode={row['decode_tps']:.1f} tok/s")
+            del llm
+    except KeyboardInterrupt:
+        console.print("[bold yellow]Interrupted; writing the cells finished so far.[/bold yellow]")
+    finally:
+        if rows:
+            if str(output).endswith('.json'):
+                with open(output, 'w') as f:
+                    json.dump(rows, f, indent=2)
+            else:
+                with open(output, 'w', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+                    writer.writeheader()
+                    writer.writerows(rows)
+
+    if not rows:
+        console.print("[bold red]No cells fit in the requested context sizes.[/bold red]")
+        return
+    table = Table(title="Benchmark Matrix", box=box.SIMPLE)
+    for column in ("Model", "Quant", "Threads", "Batch", "Ctx", "Prompt", "Gen", "TTFT (s)", "Prefill tok/s", "Decode tok/s"):
+        table.add_column(column)
+    for row in rows:
+        table.add_row(row["model"], row["quant"], str(row["n_threads"]), str(row["n_batch"]), str(row["n_ctx"]),
+                      str(row["prompt_tokens"]), str(row["gen_tokens"]), f"{row['ttft_s']:.3f}",
+                      f"{row['prefill_tps']:.1f}", f"{row['decode_tps']:.1f}")
+    console.print(table)
+    console.print(f"✅ {len(rows)} rows written to {output}")
+
+@cli.command()
+@click.option('--model', 'model_name', help='Model to load in-process (use this or --url)')
+@click.option('--url', help='Base URL of a running easy-edge serve, e.g. http://127.0.0.1:8080')
+@click.option('--prompt', '-p', help='Prompt to send')
+@click.option('--promptfile', type=click.Path(exists=True), help='Path to a file with prompts (Modelfile MESSAGE format)')
+@click.option('--rate', 'rates', default='1', help='Arrival rate(s) in requests/sec, comma-separated to sweep (default: 1)')
+@click.option('--arrival', default='poisson', type=click.Choice(['poisson', 'fixed']), help='Arrival process (default: poisson)')
+@click.option('--duration', default=30.0, type=float, help='Seconds to generate load at each rate (default: 30)')
+@click.option('--concurrency', default=64, type=int, help='Maximum concurrent clients (default: 64)')
+@click.option('--max-tokens', type=int, help='Tokens to generate per request (default: from settings)')
+@click.option('--slo', default=5.0, type=float, help='End-to-end latency SLO in seconds for goodput (default: 5)')
+@click.option('--slots', default=1, type=int, help='Sequences decoded together by the in-process engine (default: 1)')
+@click.option('--baseline', type=click.Path(), help='Baseline JSON file to compare against')
+@click.option('--save-baseline', is_flag=True, help='Write the results to --baseline instead of comparing')
+@click.option('--threshold', default=0.1, type=float, help='Allowed relative regression against the baseline (default: 0.1)')
+@click.option('--seed', default=0, type=int, help='Random seed for arrivals (default: 0)')
+@click.pass_context
+def loadtest(ctx, model_name, url, prompt, promptfile, rates, arrival, duration, concurrency, max_tokens, slo, slots, baseline, save_baseline, threshold, seed):
+    """Generate concurrent load and report latency percentiles, goodput and saturation."""
+    easy_edge = ctx.obj['easy_edge']
+    if bool(model_name) == bool(url):
+        console.print("[bold red]Provide exactly one of --model or --url.[/bold red]")
+        return
+    if promptfile:
+        try:
+            prompts = read_prompt_file(promptfile)
+        except ValueError as e:
+            console.print(f"❌ {e}")
+            return
+        if not prompts:
+            console.print(f"[bold red]No valid user MESSAGE lines found in {promptfile}![/bold red]")
+            return
+    elif prompt:
+        prompts = [prompt]
+    else:
+        console.print("[bold red]You must provide either --prompt or --promptfile.[/bold red]")
+        return
+    try:
+        rates = [float(rate) for rate in rates.split(',') if rate.strip()]
+    except ValueError:
+        console.print(f"[bold red]Invalid --rate value: {rates}[/bold red]")
+        return
+    if not rates or not all(0 < rate < math.inf for rate in rates):
+        console.print("[bold red]--rate values must be positive numbers.[/bold red]")
+        return
+    if duration <= 0:
+        console.print("[bold red]--duration must be positive.[/bold red]")
+        return
+    if concurrency < 1:
+        console.print("[bold red]--concurrency must be at least 1.[/bold red]")
+        return
+    params = easy_edge.generation_params()
+    if max_tokens:
+        params["max_tokens"] = max_tokens
+
+    scheduler = None
+    batched = None
+    if model_name:
+        if not easy_edge.get_model_path(model_name):
+            console.print(f"❌ Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+            return
+        slots = max(1, slots)
+        console.print(f"[bold green]Loading model {model_name} into {slots} slot(s)...[/bold green]")
+        engines, batched = easy_edge.load_slots(model_name, slots)
+        scheduler = RequestScheduler(engines, max_queue=concurrency)
+
+        def send(prompt_text, client_id):
+            return scheduler.generate(prompt_text, client_id=client_id, **params)
+        target = model_name
+    else:
+        endpoint = url.rstrip('/') + '/generate'
+
+        def send(prompt_text, client_id):
+            response = requests.post(endpoint, json={"prompt": prompt_text, "client_id": client_id, **params}, timeout=max(60.0, slo * 10))
+            if response.status_code == 429:
+                raise SchedulerFull(response.text)
+            response.raise_for_status()
+            return response.json()
+        target = url
+
+    steps = []
+    try:
+        for rate in rates:
+            console.print(f"[bold blue]Offering {rate:g} req/s ({arrival}) to {target} for {duration:g}s...[/bold blue]")
+            records, dropped, sent, elapsed = run_load_step(send, prompts, rate, duration, arrival, concurrency, seed)
+            steps.append(summarize_load_step(records, dropped, sent, elapsed, rate, slo))
+    finally:
+        if scheduler is not None:
+            scheduler.shutdown()
+        if batched is not None:
+            batched.close()
+
+    table = Table(title=f"Load Test Results (SLO {slo:g}s)", box=box.SIMPLE)
+    for column in ("Rate", "Done", "Rejected", "Dropped", "Failed", "Req/s", "Goodput",
+                   "TTFT p50/95/99 (s)", "E2E p50/95/99 (s)"):
+        table.add_column(column)
+    for step in steps:
+        table.add_row(
+            f"{step['rate']:g}", str(step['completed']), str(step['rejected']), str(step['dropped']), str(step['failed']),
+            f"{step['throughput']:.2f}", f"{step['goodput']:.2f}",
+            f"{step['ttft_p50']:.2f}/{step['ttft_p95']:.2f}/{step['ttft_p99']:.2f}",
+            f"{step['latency_p50']:.2f}/{step['latency_p95']:.2f}/{step['latency_p99']:.2f}"
+        )
+    console.print(table)
+    saturation = find_saturation_point(steps, slo)
+    if saturation is None:
+        console.print("Saturation point: below the lowest offered rate")
+    elif saturation == max(rates):
+        console.print(f"Saturation point: not reached (sustained {saturation:g} req/s)")
+    else:
+        console.print(f"Saturation point: ~{saturation:g} req/s")
+
+    if not baseline:
+        return
+    results = {"target": target, "arrival": arrival, "duration": duration, "slo": slo, "saturation": saturation, "steps": steps}
+    if save_baseline or not Path(baseline).exists():
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        console.print(f"✅ Baseline saved to {baseline}")
+        return
+    with open(baseline, 'r') as f:
+        regressions = compare_load_baseline(steps, json.load(f)["steps"], threshold)
+    if regressions:
+        console.print(f"[bold red]Regressed more than {threshold:.0%} against {baseline}:[/bold red]")
+        for regression in regressions:
+            console.print(f"  ❌ {regression}")
+        ctx.exit(1)
+    console.print(f"✅ Within {threshold:.0%} of baseline {baseline}")
+
+@cli.command()
+@click.argument('model_name')
+@click.option('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+@click.option('--port', default=8080, type=int, help='Port to listen on (default: 8080)')
+@click.option('--slots', default=1, type=int, help='Sequences decoded together in one batched context (default: 1)')
+@click.option('--max-queue', default=64, type=int, help='Queued requests allowed before rejecting with 429 (default: 64)')
+@click.option('--timeout', default=None, type=float, help='Default per-request deadline in seconds')
+@click.option('--workers', default=0, type=int, help='Pre-fork this many pinned worker processes instead of in-process slots')
+@click.pass_context
+def serve(ctx, model_name, host, port, slots, max_queue, timeout, workers):
+    """Serve a model over HTTP with a bounded, fair request queue."""
+    easy_edge = ctx.obj['easy_edge']
+    model_path = easy_edge.get_model_path(model_name)
+    if not model_path:
+        console.print(f"❌ Model '{model_name}' not found. Use 'easy-edge pull <model>' to download it.")
+        return
+
+    pool = None
+    batched = None
+    if workers > 0:
+        console.print(f"[bold green]Starting {workers} worker(s) for {model_name}...[/bold green]")
+        try:
+            pool = WorkerPool(model_path, workers, llama_kwargs={"n_ctx": 2048})
+        except RuntimeError as e:
+            console.print(f"❌ {e}")
+            return
+        for worker in pool.stats():
+            cpus = f"{len(worker['cpus'])} CPU(s) from {worker['cpus'][0]}" if worker['cpus'] else "unpinned"
+            console.print(f"  Worker {worker['index']}: pid {worker['pid']}, {cpus}")
+        engines = pool.workers
+    else:
+        slots = max(1, slots)
+        console.print(f"[bold green]Loading model {model_name} into {slots} slot(s)...[/bold green]")
+        engines, batched = easy_edge.load_slots(model_name, slots)
+        if batched is not None:
+            console.print(f"  {slots} sequences batched in one context, {batched.n_batch} tokens per batch")
+    scheduler = RequestScheduler(engines, max_queue=max_queue, default_timeout=timeout)
+
+    handler = type('Handler', (InferenceRequestHandler,), {
+        'scheduler': scheduler,
+        'pool': pool,
+        'batched': batched,
+        'defaults': easy_edge.generation_params(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    console.print(f"✅ Serving {model_name} on http://{host}:{port} (POST /generate, POST /cancel, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.shutdown()
+        if pool is not None:
+            pool.shutdown()
+        if batched is not None:
+            batched.close()
+        console.print("\nGoodbye!")
+
 if __name__ == '__main__':
     cli() 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures for Easy Edge tests
+
+FakeLlama is a deterministic stand-in for llama_cpp.Llama that simulates
+prefill and decode cost, so serving, benchmarking and tooling can be
+exercised without a GGUF. It is registered as llama_cpp when the real
+package is not installed.
+"""
+
+import json
+import sys
+import time
+import types
+import zlib
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+class FakeLlama:
+    """Deterministic llama_cpp.Llama stand-in that sleeps for simulated prefill and decode time"""
+    PREFILL_SECONDS_PER_TOKEN = 0.00005
+    DECODE_SECONDS_PER_TOKEN = 0.0002
+    MAX_COMPLETION_TOKENS = 16
+    engine_seconds = 0.0
+    metadata = {
+        "general.architecture": "llama",
+        "llama.block_count": "16",
+        "llama.embedding_length": "2048",
+        "llama.attention.head_count": "32",
+        "llama.attention.head_count_kv": "8",
+    }
+    n_batch = 512
+
+    def __init__(self, model_path=None, n_ctx=2048, n_threads=None, **kwargs):
+        self._n_ctx = n_ctx
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def n_vocab(self):
+        return 32000
+
+    def token_bos(self):
+        return 1
+
+    def token_eos(self):
+        return 2
+
+    def reset(self):
+        pass
+
+    def n_embd(self):
+        return 32
+
+    def embed(self, texts):
+        """Bag-of-words vectors: texts sharing words point in similar directions"""
+        rows = []
+        for text in texts:
+            row = [0.0] * self.n_embd()
+            for word in text.lower().split():
+                row[zlib.crc32(word.encode()) % self.n_embd()] += 1.0
+            rows.append(row)
+        return rows
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return [1] * (len(text.split()) + int(add_bos))
+
+    def __call__(self, prompt, max_tokens=16, stream=False, **kwargs):
+        prompt_tokens = len(prompt) if isinstance(prompt, list) else len(prompt.split()) + 1
+        completion_tokens = min(max_tokens, self.MAX_COMPLETION_TOKENS)
+        self._spend(prompt_tokens * self.PREFILL_SECONDS_PER_TOKEN)
+        if stream:
+            return self._stream(completion_tokens)
+        self._spend(completion_tokens * self.DECODE_SECONDS_PER_TOKEN)
+        return {
+            "choices": [{"text": "token " * completion_tokens, "finish_reason": "length"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+        }
+
+    def _stream(self, completion_tokens):
+        for i in range(completion_tokens):
+            self._spend(self.DECODE_SECONDS_PER_TOKEN)
+            yield {"choices": [{"text": "token ", "finish_reason": "length" if i == completion_tokens - 1 else None}]}
+
+    @classmethod
+    def _spend(cls, seconds):
+        # Count what the sleep actually took, so its overshoot isn't billed as overhead
+        start = time.perf_counter()
+        time.sleep(seconds)
+        cls.engine_seconds += time.perf_counter() - start
+
+try:
+    import llama_cpp
+    HAVE_LLAMA_CPP = True
+except ImportError:
+    stub = types.ModuleType("llama_cpp")
+    stub.Llama = FakeLlama
+    sys.modules["llama_cpp"] = stub
+    HAVE_LLAMA_CPP = False
+
+sys.path.insert(0, str(REPO_ROOT))
+import easy_edge
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    """A models directory with one registered fake model"""
+    monkeypatch.setattr(easy_edge, "Llama", FakeLlama)
+    (tmp_path / "fake.gguf").write_bytes(b"GGUF")
+    config = {
+        "models": {"fake": {"filename": "fake.gguf", "original_filename": "fake-Q4_0.gguf", "size": 4}},
+        "default_model": None,
+        "settings": {"max_tokens": 16, "temperature": 0.7, "top_p": 0.9},
+    }
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    return tmp_path
@@ -49,4 +49,67 @@ def test_requirements_file_exists():
 def test_package_json_exists():
     """Test that package.json exists"""
     package_json = Path("package.json")
-    assert package_json.exists(), "package.json should exist" 
\ No newline at end of file
+    assert package_json.exists(), "package.json should exist"
+
+def test_serve_help_command():
+    """Test that the serve command exposes its queueing options"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "serve", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--max-queue" in result.stdout
+    assert "--slots" in result.stdout
+
+def test_warm_help_command():
+    """Test that the warm command is available"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "warm", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--lock" in result.stdout
+    assert "--save" in result.stdout
+
+def test_python_api_exports():
+    """Test that the async and sync library clients are importable"""
+    result = subprocess.run([sys.executable, "-c",
+                             "import easy_edge; print(easy_edge.AsyncClient.__name__, easy_edge.Client.__name__)"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "AsyncClient Client" in result.stdout
+
+def test_embed_and_search_help_commands():
+    """Test that the embedding commands are available"""
+    for command, option in (("embed", "--batch-size"), ("search", "--top-k")):
+        result = subprocess.run([sys.executable, "easy_edge.py", command, "--help"],
+                              capture_output=True, text=True)
+        assert result.returncode == 0
+        assert option in result.stdout
+
+def test_metrics_options():
+    """Test that the metrics export options are available"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--metrics-port" in result.stdout
+    assert "--metrics-file" in result.stdout
+
+def test_loadtest_help_command():
+    """Test that the load generator is available"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "loadtest", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--arrival" in result.stdout
+    assert "--baseline" in result.stdout
+
+def test_benchmark_matrix_help_command():
+    """Test that the benchmark matrix mode is available"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "benchmark-matrix", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--prompt-tokens" in result.stdout
+    assert "--threads" in result.stdout
+
+def test_benchmark_memory_sampling_option():
+    """Test that benchmark exposes the memory sampling interval"""
+    result = subprocess.run([sys.executable, "easy_edge.py", "benchmark", "--help"],
+                          capture_output=True, text=True)
+    assert result.returncode == 0
+    assert "--mem-interval" in result.stdout
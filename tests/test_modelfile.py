@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming Modelfile reader
+"""
+
+import pytest
+from click.testing import CliRunner
+
+import easy_edge
+
+def write(tmp_path, text):
+    path = tmp_path / "Modelfile"
+    path.write_text(text)
+    return str(path)
+
+def test_multiline_blocks_and_pairs(tmp_path):
+    """Triple-quoted SYSTEM, TEMPLATE and MESSAGE values span lines; pairs are user then assistant"""
+    path = write(tmp_path, (
+        "# comment\n"
+        "FROM org/model\n"
+        "PARAMETER epochs 3\n"
+        'SYSTEM """You are\n'
+        'a helpful assistant."""\n'
+        'TEMPLATE """{{ .System }}\n'
+        "User: {{ .Prompt }}\n"
+        '"""\n'
+        "MESSAGE user Hi there\n"
+        'MESSAGE assistant """Hello!\n'
+        'How can I help?"""\n'
+        "MESSAGE user '''one-liner'''\n"
+        "MESSAGE assistant ok\n"
+    ))
+    config = easy_edge.parse_modelfile(path)
+    assert config["FROM"] == "org/model"
+    assert config["PARAMETER"] == {"epochs": "3"}
+    assert config["SYSTEM"] == "You are\na helpful assistant."
+    assert config["TEMPLATE"] == "{{ .System }}\nUser: {{ .Prompt }}"
+    assert list(easy_edge.iter_training_pairs(path)) == [("Hi there", "Hello!\nHow can I help?"), ("one-liner", "ok")]
+    assert easy_edge.read_prompt_file(path) == ["Hi there", "one-liner"]
+    assert easy_edge.parse_modelfile(path, messages=False)["MESSAGES"] == []
+
+def test_unclosed_block_raises_with_line_number(tmp_path):
+    """A stray opening quote is an error, not a block that swallows the rest of the file"""
+    path = write(tmp_path, (
+        "FROM org/model\n"
+        'MESSAGE user """oops\n'
+        "MESSAGE assistant first answer\n"
+        "MESSAGE user second question\n"
+        "MESSAGE assistant second answer\n"
+    ))
+    with pytest.raises(ValueError, match=r'Modelfile:2: """ block is never closed'):
+        list(easy_edge.iter_training_pairs(path))
+    with pytest.raises(ValueError):
+        easy_edge.parse_modelfile(path)
+
+def test_benchmark_reports_unclosed_block(models_dir, tmp_path):
+    """benchmark --promptfile prints the parse error instead of benchmarking a truncated file"""
+    path = write(tmp_path, 'MESSAGE user """oops\nMESSAGE user fine\n')
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark",
+                                                "--model", "fake", "--promptfile", path])
+    assert result.exit_code == 0, result.output
+    assert "block is never closed" in result.output
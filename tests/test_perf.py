@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks and perf-regression checks for Easy Edge
+
+Everything runs against FakeLlama, a deterministic stand-in for llama_cpp.Llama
+that simulates prefill and decode cost, so no GGUF is needed. A plain run only
+checks behaviour; timings are compared with tests/perf_baselines.json when
+asked to:
+
+    EASY_EDGE_PERF_CHECK=1                fail on a slowdown over a baseline
+    EASY_EDGE_PERF_TOLERANCE=0.5          allowed slowdown (default: 50%)
+    EASY_EDGE_UPDATE_PERF_BASELINES=1     rewrite the baselines from this machine
+    EASY_EDGE_TEST_GGUF=/path/tiny.gguf   also run benchmark against a real model
+
+Baselines are stored in calibration units: multiples of a fixed pure-Python
+workload timed in the same process just before the check. A slower or busier
+machine slows both, so the ratio moves far less than wall time does.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from conftest import FakeLlama, HAVE_LLAMA_CPP, REPO_ROOT
+import easy_edge
+
+BASELINES_PATH = Path(__file__).with_name("perf_baselines.json")
+UPDATE_BASELINES = os.environ.get("EASY_EDGE_UPDATE_PERF_BASELINES") == "1"
+CHECK_BASELINES = os.environ.get("EASY_EDGE_PERF_CHECK") == "1"
+TOLERANCE = float(os.environ.get("EASY_EDGE_PERF_TOLERANCE", "0.5"))
+
+def best_of(runs, fn):
+    """Fastest wall time of fn over several runs"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def best_overhead(runs, fn):
+    """Fastest time of fn over several runs, less the time spent inside FakeLlama"""
+    best = float("inf")
+    for _ in range(runs):
+        FakeLlama.engine_seconds = 0.0
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start - FakeLlama.engine_seconds)
+    return best
+
+def calibration_seconds():
+    """Fastest time of a fixed JSON round trip, the unit baselines are stored in"""
+    data = {f"key-{i}": [i, str(i), {"n": i}] for i in range(20000)}
+    return best_of(5, lambda: json.loads(json.dumps(data)))
+
+def check_baseline(name, measure):
+    """Run measure() and compare its seconds, in calibration units, with the stored baseline (opt-in)"""
+    seconds = measure()
+    if not (UPDATE_BASELINES or CHECK_BASELINES):
+        return
+    units = seconds / calibration_seconds()
+    baselines = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+    if UPDATE_BASELINES:
+        baselines[name] = round(units, 3)
+        BASELINES_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        return
+    assert name in baselines, f"No baseline for {name}; run with EASY_EDGE_UPDATE_PERF_BASELINES=1"
+    budget = baselines[name] * (1 + TOLERANCE)
+    for _ in range(2):
+        if units <= budget:
+            break
+        # A real regression shows up again; a burst of load from elsewhere rarely does
+        units = min(units, measure() / calibration_seconds())
+    assert units <= budget, f"{name}: {units:.3f} calibration units exceeds baseline {baselines[name]:.3f} (+{TOLERANCE:.0%})"
+
+# Stands in for the ML stack so startup measures Easy Edge itself, whatever is installed
+STUB_HEAVY_IMPORTS = (
+    "import sys, types\n"
+    "def stub(name):\n"
+    "    module = types.ModuleType(name)\n"
+    "    module.__getattr__ = lambda attr: type(attr, (), {})\n"
+    "    sys.modules[name] = module\n"
+    "for name in ('torch', 'transformers', 'datasets', 'peft', 'bitsandbytes', 'huggingface_hub', 'llama_cpp'):\n"
+    "    stub(name)\n"
+)
+
+def test_cli_startup_time():
+    """Time `easy-edge --help` over a bare interpreter, with the ML stack stubbed"""
+    cli = STUB_HEAVY_IMPORTS + (
+        f"sys.path.insert(0, {str(REPO_ROOT)!r})\n"
+        "import easy_edge\n"
+        "easy_edge.cli(['--help'], standalone_mode=False)\n"
+    )
+    def run(code):
+        def start():
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_ROOT)
+            assert result.returncode == 0, result.stderr
+            return result.stdout
+        return start
+    assert "serve" in run(cli)()
+    check_baseline("cli_startup", lambda: max(best_of(5, run(cli)) - best_of(5, run(STUB_HEAVY_IMPORTS)), 0.0))
+
+def test_parse_large_modelfile(tmp_path):
+    """Parse a Modelfile with 100k MESSAGE lines"""
+    modelfile = tmp_path / "Modelfile"
+    with open(modelfile, "w") as f:
+        f.write("FROM meta-llama/Llama-3.2-1B-Instruct\nPARAMETER epochs 1\nSYSTEM You are a helpful assistant.\n")
+        for i in range(50000):
+            f.write(f"MESSAGE user How do I reset password number {i}?\n")
+            f.write(f"MESSAGE assistant Click 'Forgot Password' and follow step {i}.\n")
+    check_baseline("parse_modelfile_100k_messages", lambda: best_of(3, lambda: easy_edge.parse_modelfile(str(modelfile))))
+
+def test_stream_modelfile_messages_memory(tmp_path):
+    """Streaming 100k multi-line MESSAGE blocks keeps peak memory flat"""
+    modelfile = tmp_path / "Modelfile"
+    with open(modelfile, "w") as f:
+        f.write('FROM meta-llama/Llama-3.2-1B-Instruct\nSYSTEM """You are\na helpful assistant."""\n')
+        for i in range(50000):
+            f.write(f"MESSAGE user How do I reset password number {i}?\n")
+            f.write(f'MESSAGE assistant """Click \'Forgot Password\'.\nThen follow step {i}."""\n')
+    tracemalloc.start()
+    pairs = sum(1 for _ in easy_edge.iter_training_pairs(str(modelfile)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert pairs == 50000
+    assert peak < 4 * 1024 * 1024, f"peak {peak / 1e6:.1f} MB while streaming"
+
+def test_registry_load_and_save(tmp_path):
+    """Load and save a registry with 5000 models"""
+    config = {
+        "models": {
+            f"model-{i}": {"filename": f"model-{i}.gguf", "repo_id": f"org/model-{i}",
+                           "original_filename": f"model-{i}-Q4_0.gguf", "size": 773025824}
+            for i in range(5000)
+        },
+        "default_model": None,
+        "settings": {"max_tokens": 2048, "temperature": 0.7, "top_p": 0.9},
+    }
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    def load_and_save():
+        registry = easy_edge.EasyEdge(str(tmp_path))
+        assert len(registry.config["models"]) == 5000
+        registry.save_config()
+    check_baseline("registry_load_save_5000_models", lambda: best_of(5, load_and_save))
+
+def test_benchmark_control_flow_overhead(models_dir, tmp_path):
+    """Time spent in benchmark outside the (fake) engine over 100 requests"""
+    promptfile = tmp_path / "prompts.txt"
+    promptfile.write_text("".join(f"MESSAGE user Prompt number {i} about edge inference\n" for i in range(50)))
+    runner = CliRunner()
+    def run_benchmark():
+        result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark",
+                                               "--model", "fake", "--promptfile", str(promptfile),
+                                               "--repeat", "2", "--mem-interval", "0.01"])
+        assert result.exit_code == 0, result.output
+        assert "Benchmark Results" in result.output
+    check_baseline("benchmark_overhead_100_requests", lambda: best_overhead(3, run_benchmark))
+
+def test_run_control_flow_overhead(models_dir):
+    """Time spent in run outside the (fake) engine for a single prompt"""
+    runner = CliRunner()
+    def run_prompt():
+        result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "run", "fake", "--prompt", "Hello there"])
+        assert result.exit_code == 0, result.output
+        assert "Response" in result.output
+    check_baseline("run_overhead", lambda: best_overhead(5, run_prompt))
+
+@pytest.mark.skipif(not os.environ.get("EASY_EDGE_TEST_GGUF"), reason="EASY_EDGE_TEST_GGUF not set")
+@pytest.mark.skipif(not HAVE_LLAMA_CPP, reason="llama-cpp-python not installed")
+def test_benchmark_with_real_gguf(tmp_path):
+    """Run benchmark end to end against a small real GGUF"""
+    gguf = Path(os.environ["EASY_EDGE_TEST_GGUF"])
+    shutil.copy(gguf, tmp_path / "tiny.gguf")
+    config = {
+        "models": {"tiny": {"filename": "tiny.gguf", "original_filename": gguf.name, "size": gguf.stat().st_size}},
+        "default_model": None,
+        "settings": {"max_tokens": 16, "temperature": 0.7, "top_p": 0.9},
+    }
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(tmp_path), "benchmark",
+                                                "--model", "tiny", "--prompt", "Hello", "--repeat", "3"])
+    assert result.exit_code == 0, result.output
+    assert "Benchmark Results" in result.output
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Tests for the request scheduler, workers, HTTP front end, clients and metrics
+"""
+
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import FakeLlama, HAVE_LLAMA_CPP
+import easy_edge
+
+class SlowLlama(FakeLlama):
+    """FakeLlama slow enough that a request is still running when the test acts on it"""
+    DECODE_SECONDS_PER_TOKEN = 0.05
+
+@pytest.fixture
+def server():
+    """An InferenceRequestHandler on an ephemeral port in front of one SlowLlama slot"""
+    scheduler = easy_edge.RequestScheduler([SlowLlama()], max_queue=4)
+    handler = type('Handler', (easy_edge.InferenceRequestHandler,), {
+        'scheduler': scheduler,
+        'pool': None,
+        'defaults': {"max_tokens": 4},
+    })
+    httpd = easy_edge.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", scheduler
+    httpd.shutdown()
+    httpd.server_close()
+    scheduler.shutdown()
+
+def post(url, body):
+    """POST raw JSON and return (status, decoded response)"""
+    data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_generate_returns_completion(server):
+    """A valid request is scheduled and returns text and timings"""
+    url, _ = server
+    status, payload = post(url + "/generate", {"prompt": "Hello there", "timeout": 5})
+    assert status == 200
+    assert payload["text"] == "token " * 4
+    assert payload["usage"]["completion_tokens"] == 4
+
+@pytest.mark.parametrize("body", [
+    [1, 2, 3],
+    "prompt",
+    {"prompt": ""},
+    {"prompt": 42},
+    {"prompt": "Hi", "timeout": "5"},
+    {"prompt": "Hi", "timeout": -1},
+    {"prompt": "Hi", "max_tokens": "16"},
+    {"prompt": "Hi", "max_tokens": 0},
+    {"prompt": "Hi", "temperature": "hot"},
+    {"prompt": "Hi", "top_p": True},
+    {"prompt": "Hi", "stop": 5},
+    {"prompt": "Hi", "stop": ["\n", 5]},
+])
+def test_generate_rejects_bad_input(server, body):
+    """Malformed bodies get a 400 with a reason instead of a dropped connection"""
+    url, _ = server
+    status, payload = post(url + "/generate", body)
+    assert status == 400
+    assert payload["error"]
+
+def test_cancel_accepts_string_id(server):
+    """/cancel casts the id, so "3" finds request 3, and rejects ids that are not integers"""
+    url, scheduler = server
+    responses = []
+    client = threading.Thread(target=lambda: responses.append(post(url + "/generate", {"prompt": "Hi", "max_tokens": 16})))
+    client.start()
+    while not scheduler._live:
+        time.sleep(0.01)
+    request_id = next(iter(scheduler._live))
+    assert post(url + "/cancel", {"id": str(request_id)}) == (200, {"cancelled": request_id})
+    client.join()
+    assert responses[0][0] == 409
+    assert post(url + "/cancel", {"id": "999999"})[0] == 404
+    assert post(url + "/cancel", {"id": "abc"})[0] == 400
+    assert post(url + "/cancel", {})[0] == 400
+
+class GatedLlama(FakeLlama):
+    """FakeLlama that records prompts in order and holds the prompt 'block' until released"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = []
+        self.release = threading.Event()
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if prompt == "block":
+            self.release.wait(10)
+        return super().__call__(prompt, **kwargs)
+
+def wait_until(predicate, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "condition not reached"
+        time.sleep(0.005)
+
+def test_scheduler_rejects_when_queue_full():
+    """Submissions past max_queue raise SchedulerFull; the running request does not count"""
+    engine = GatedLlama()
+    scheduler = easy_edge.RequestScheduler([engine], max_queue=2)
+    running = scheduler.submit("block")
+    wait_until(lambda: scheduler.metrics()["active"] == 1)
+    queued = [scheduler.submit(f"queued {i}") for i in range(2)]
+    with pytest.raises(easy_edge.SchedulerFull):
+        scheduler.submit("one too many")
+    assert scheduler.metrics()["rejected"] == 1
+    engine.release.set()
+    for request in [running] + queued:
+        assert request.wait(5)["finish_reason"] == "length"
+    assert scheduler.metrics()["completed"] == 3
+    scheduler.shutdown()
+
+def test_scheduler_expires_queued_and_running_requests():
+    """A request past its deadline fails with DeadlineExceeded whether queued or running"""
+    engine = GatedLlama()
+    scheduler = easy_edge.RequestScheduler([engine], max_queue=4)
+    blocker = scheduler.submit("block")
+    wait_until(lambda: scheduler.metrics()["active"] == 1)
+    queued = scheduler.submit("queued", timeout=0.05)
+    with pytest.raises(easy_edge.DeadlineExceeded):
+        queued.wait(5)
+    assert "queued" not in engine.prompts
+    engine.release.set()
+    blocker.wait(5)
+
+    slow = easy_edge.RequestScheduler([SlowLlama()], max_queue=4)
+    running = slow.submit("runs too long", timeout=0.1, max_tokens=16)
+    with pytest.raises(easy_edge.DeadlineExceeded):
+        running.wait(5)
+    assert 0 < running.completion_tokens < 16
+    assert scheduler.metrics()["expired"] == 1
+    assert slow.metrics()["expired"] == 1
+    scheduler.shutdown()
+    slow.shutdown()
+
+def test_scheduler_cancels_queued_and_running_requests():
+    """Cancelling by id drops a queued request and stops a running one at its next token"""
+    scheduler = easy_edge.RequestScheduler([SlowLlama()], max_queue=4)
+    running = scheduler.submit("running", max_tokens=16)
+    queued = scheduler.submit("queued", max_tokens=16)
+    wait_until(lambda: running.completion_tokens > 0)
+    assert scheduler.cancel(queued.id)
+    assert scheduler.cancel(running.id)
+    assert not scheduler.cancel(123456789)
+    for request in (running, queued):
+        with pytest.raises(easy_edge.RequestCancelled):
+            request.wait(5)
+    assert queued.started_at is None
+    assert running.completion_tokens < 16
+    assert scheduler.metrics()["cancelled"] == 2
+    scheduler.shutdown()
+
+def test_scheduler_round_robin_across_clients():
+    """A client with a backlog cannot starve another client"""
+    engine = GatedLlama()
+    scheduler = easy_edge.RequestScheduler([engine], max_queue=8)
+    blocker = scheduler.submit("block")
+    wait_until(lambda: scheduler.metrics()["active"] == 1)
+    requests = [scheduler.submit(f"a{i}", client_id="a") for i in range(3)]
+    requests += [scheduler.submit(f"b{i}", client_id="b") for i in range(2)]
+    engine.release.set()
+    for request in [blocker] + requests:
+        request.wait(5)
+    assert engine.prompts == ["block", "a0", "b0", "a1", "b1", "a2"]
+    scheduler.shutdown()
+
+def test_scheduler_takes_usage_from_the_engine():
+    """Chunks are not tokens: the count reported with the final chunk wins"""
+    def engine(prompt, stream=True, **params):
+        # Four tokens whose text was held back and merged, as for a stop-string prefix
+        yield {"choices": [{"text": "Hel", "finish_reason": None}]}
+        yield {"choices": [{"text": "lo!", "finish_reason": "length"}], "usage": {"completion_tokens": 4}}
+    scheduler = easy_edge.RequestScheduler([engine])
+    result = scheduler.generate("Hi", max_tokens=4)
+    scheduler.shutdown()
+    assert result["text"] == "Hello!"
+    assert result["usage"]["completion_tokens"] == 4
+
+def test_worker_pool_restarts_killed_worker(tmp_path):
+    """A SIGKILLed worker fails its request and is replaced, and the pool keeps serving"""
+    model_path = tmp_path / "fake.gguf"
+    model_path.write_bytes(b"GGUF")
+    pool = easy_edge.WorkerPool(model_path, 1, check_interval=0.05, engine_factory=SlowLlama)
+    try:
+        worker = pool.workers[0]
+        first_pid = worker.process.pid
+        scheduler = easy_edge.RequestScheduler(pool.workers, max_queue=4)
+        assert scheduler.generate("warm up", max_tokens=2)["text"] == "token token "
+
+        # Killed mid-request: the request fails and the worker is restarted before the next one
+        request = scheduler.submit("doomed", max_tokens=16)
+        wait_until(lambda: request.completion_tokens > 0)
+        os.kill(worker.process.pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="died"):
+            request.wait(10)
+        assert worker.alive and worker.process.pid != first_pid
+
+        # Killed while idle: the monitor thread restarts it
+        idle_pid = worker.process.pid
+        os.kill(idle_pid, signal.SIGKILL)
+        wait_until(lambda: pool.stats()[0]["restarts"] == 2 and pool.stats()[0]["alive"], timeout=10)
+        assert pool.stats()[0]["pid"] != idle_pid
+        assert scheduler.generate("after restart", max_tokens=2)["text"] == "token token "
+        scheduler.shutdown()
+    finally:
+        pool.shutdown()
+    assert not worker.alive
+
+def test_worker_stops_promptly_mid_generation(tmp_path):
+    """A stop that interrupts generation ends the worker instead of waiting to be killed"""
+    model_path = tmp_path / "fake.gguf"
+    model_path.write_bytes(b"GGUF")
+    worker = easy_edge.InferenceWorker(0, str(model_path), None, engine_factory=SlowLlama)
+    worker.conn.send(('generate', "long", {"max_tokens": 16}))
+    assert worker.conn.recv()[0] == 'chunk'
+    start = time.monotonic()
+    worker.stop()
+    assert time.monotonic() - start < 2
+    assert worker.process.exitcode == 0
+
+def test_load_slots_falls_back_to_one_context_per_slot(models_dir):
+    """A model that can't be batched still gets one engine per slot"""
+    easy = easy_edge.EasyEdge(str(models_dir))
+    engines, batched = easy.load_slots("fake", 2)
+    assert batched is None
+    assert len(engines) == 2 and all(isinstance(engine, FakeLlama) for engine in engines)
+    with pytest.raises(FileNotFoundError):
+        easy.load_slots("missing", 2)
+
+@pytest.fixture
+def batched_llama():
+    """A BatchedLlama with two slots over the GGUF named by EASY_EDGE_TEST_GGUF"""
+    if not HAVE_LLAMA_CPP:
+        pytest.skip("llama-cpp-python not installed")
+    if not os.environ.get("EASY_EDGE_TEST_GGUF"):
+        pytest.skip("EASY_EDGE_TEST_GGUF not set")
+    batched = easy_edge.BatchedLlama(os.environ["EASY_EDGE_TEST_GGUF"], 2, n_ctx=256)
+    yield batched
+    batched.close()
+
+def test_batched_slots_decode_together(batched_llama):
+    """Concurrent requests share decode steps and each stops at its own max_tokens"""
+    scheduler = easy_edge.RequestScheduler(batched_llama.slot_engines(), max_queue=4)
+    requests = [scheduler.submit(f"Story {i}:", max_tokens=24 + 8 * i, temperature=0) for i in range(2)]
+    results = [request.wait(60) for request in requests]
+    scheduler.shutdown()
+    for i, result in enumerate(results):
+        assert result["finish_reason"] in ("length", "stop")
+        assert 0 < result["usage"]["completion_tokens"] <= 24 + 8 * i
+    # Both prompts are prefilled in the first step, then each step carries a token per running sequence
+    assert batched_llama.stats()["tokens_per_step"] > 1
+
+def test_completion_tokens_count_sampled_tokens(batched_llama):
+    """usage.completion_tokens matches max_tokens for Llama and batched slots alike"""
+    llm = easy_edge.Llama(os.environ["EASY_EDGE_TEST_GGUF"], n_ctx=256, verbose=False)
+    for engines in ([llm], batched_llama.slot_engines()):
+        scheduler = easy_edge.RequestScheduler(engines)
+        result = scheduler.generate("Once upon a time", max_tokens=20, temperature=0)
+        scheduler.shutdown()
+        assert result["finish_reason"] == "length"
+        assert result["usage"]["completion_tokens"] == 20
+    assert "sample" not in vars(llm)
+
+def test_batched_slot_is_reusable_after_cancel(batched_llama):
+    """An abandoned stream frees its sequence id, so the slot's next request decodes cleanly"""
+    engine = batched_llama.slot_engines()[0]
+    expected = "".join(chunk["choices"][0]["text"] for chunk in engine("Once upon a time", max_tokens=8, temperature=0))
+    stream = engine("A different prompt that fills the cache", max_tokens=64, temperature=0)
+    next(stream)
+    stream.close()
+    again = "".join(chunk["choices"][0]["text"] for chunk in engine("Once upon a time", max_tokens=8, temperature=0))
+    assert again == expected
+
+def test_async_client_generate_and_cancel(models_dir, monkeypatch):
+    """AsyncClient streams tokens and stops generating when the consumer stops"""
+    monkeypatch.setattr(easy_edge, "Llama", SlowLlama)
+    async def main():
+        async with easy_edge.AsyncClient("fake", models_dir=str(models_dir)) as client:
+            assert await client.generate("Hello", max_tokens=3) == "token " * 3
+            SlowLlama.engine_seconds = 0.0
+            async for _ in client.stream("Tell me a story", max_tokens=16):
+                break
+            # The executor is single-threaded: this waits for the abandoned stream to stop
+            await client.load()
+            return SlowLlama.engine_seconds
+    spent = asyncio.run(main())
+    assert spent < 16 * SlowLlama.DECODE_SECONDS_PER_TOKEN / 2
+
+def test_client_blocking_api(models_dir):
+    """Client wraps the same engine for synchronous callers"""
+    with easy_edge.Client("fake", models_dir=str(models_dir)) as client:
+        assert client.generate("Hello", max_tokens=2) == "token token "
+        assert list(client.stream("Hello", max_tokens=2)) == ["token ", "token "]
+    with pytest.raises(FileNotFoundError):
+        easy_edge.Client("missing", models_dir=str(models_dir))
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """A fresh, enabled Instrumentation installed as the module-level recorder"""
+    recorder = easy_edge.Instrumentation()
+    recorder.enable()
+    monkeypatch.setattr(easy_edge, "instrumentation", recorder)
+    return recorder
+
+def test_prometheus_text_exposition(metrics):
+    """Counters, cumulative histogram buckets and escaped labels render in text format"""
+    metrics.requests.inc(model='say "hi"\n')
+    metrics.requests.inc(2, model='say "hi"\n')
+    for value in (0.004, 0.3, 1e6):
+        metrics.request_seconds.observe(value, model="m")
+    lines = metrics.prometheus_text().splitlines()
+    assert "# TYPE easy_edge_requests_total counter" in lines
+    assert 'easy_edge_requests_total{model="say \\"hi\\"\\n"} 3' in lines
+    buckets = [line for line in lines if line.startswith("easy_edge_request_seconds_bucket")]
+    assert len(buckets) == len(easy_edge.SECONDS_BUCKETS) + 1
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts) and counts[-1] == 3
+    assert buckets[-1] == 'easy_edge_request_seconds_bucket{model="m",le="+Inf"} 3'
+    assert counts[-2] == 2  # 1e6 only lands in +Inf
+    assert 'easy_edge_request_seconds_count{model="m"} 3' in lines
+    assert float(next(line for line in lines if line.startswith("easy_edge_request_seconds_sum")).split()[-1]) == pytest.approx(1e6 + 0.304)
+
+def test_otlp_json_export(metrics, tmp_path):
+    """OTLP/JSON carries monotonic sums and per-bucket (not cumulative) histogram counts"""
+    metrics.completion_tokens.inc(5, model="m")
+    metrics.request_seconds.observe(0.3, model="m")
+    metrics.request_seconds.observe(0.3, model="m")
+    path = tmp_path / "metrics.otlp.jsonl"
+    metrics.export_otlp_file(path)
+    metrics.export_otlp_file(path)
+    exports = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(exports) == 2
+    scope = exports[-1]["resourceMetrics"][0]["scopeMetrics"][0]
+    by_name = {metric["name"]: metric for metric in scope["metrics"]}
+    tokens = by_name["easy_edge_completion_tokens_total"]["sum"]
+    assert tokens["isMonotonic"] and tokens["aggregationTemporality"] == 2
+    assert tokens["dataPoints"][0]["asDouble"] == 5
+    assert tokens["dataPoints"][0]["attributes"] == [{"key": "model", "value": {"stringValue": "m"}}]
+    point = by_name["easy_edge_request_seconds"]["histogram"]["dataPoints"][0]
+    assert point["count"] == "2" and point["sum"] == pytest.approx(0.6)
+    assert len(point["bucketCounts"]) == len(point["explicitBounds"]) + 1
+    assert sum(int(c) for c in point["bucketCounts"]) == 2
+    assert by_name["easy_edge_model_load_seconds"]["histogram"]["dataPoints"] == []
+
+class SamplingLlama(FakeLlama):
+    """FakeLlama that builds a sampler per call through _init_sampler, as llama_cpp.Llama does"""
+    class Sampler:
+        def sample(self, ctx, idx=-1):
+            time.sleep(0.001)
+            return 1
+
+    def _init_sampler(self, **kwargs):
+        return self.Sampler()
+
+    def _stream(self, completion_tokens):
+        sampler = self._init_sampler()
+        for chunk in super()._stream(completion_tokens):
+            sampler.sample(None)
+            yield chunk
+
+def test_instrumented_llama_records_tokenize_and_sample_phases(metrics):
+    """Tokenization and sampling get their own phase series alongside the request totals"""
+    llm = easy_edge.InstrumentedLlama(SamplingLlama(), "m")
+    chunks = list(llm("one two three", stream=True, max_tokens=4))
+    assert len(chunks) == 4
+    phases = {dict(labels)["phase"]: value for labels, value in metrics.phase_seconds.series.items()}
+    assert set(phases) == {"tokenize", "sample"}
+    assert phases["tokenize"][2] == 1
+    assert phases["sample"][1] >= 4 * 0.001
+    assert metrics.requests.series[(("model", "m"),)] == 1
+    assert metrics.completion_tokens.series[(("model", "m"),)] == 4
+
+class TrailingChunkLlama(FakeLlama):
+    """FakeLlama that ends its stream with an empty finish_reason chunk, as llama_cpp.Llama does"""
+    def _stream(self, completion_tokens):
+        for _ in range(completion_tokens):
+            yield {"choices": [{"text": "token ", "finish_reason": None}]}
+        yield {"choices": [{"text": "", "finish_reason": "length"}]}
+
+def test_instrumented_llama_counts_text_chunks_without_usage(metrics):
+    """Without an engine count, the empty closing chunk is not counted as a token"""
+    llm = easy_edge.InstrumentedLlama(TrailingChunkLlama(), "m")
+    assert len(list(llm("one two three", stream=True, max_tokens=4))) == 5
+    assert metrics.completion_tokens.series[(("model", "m"),)] == 4
+
+def test_instrumented_llama_counts_sampled_tokens(metrics):
+    """A 20-token stream records 20 completion tokens, however its text was chunked"""
+    if not HAVE_LLAMA_CPP or not os.environ.get("EASY_EDGE_TEST_GGUF"):
+        pytest.skip("needs llama-cpp-python and EASY_EDGE_TEST_GGUF")
+    llm = easy_edge.InstrumentedLlama(easy_edge.Llama(os.environ["EASY_EDGE_TEST_GGUF"], n_ctx=256, verbose=False), "m")
+    for _ in range(2):  # the second call hits the prompt cache
+        chunks = list(llm("Once upon a time", stream=True, max_tokens=20, temperature=0))
+        assert chunks[-1]["usage"]["completion_tokens"] == 20
+    assert metrics.completion_tokens.series[(("model", "m"),)] == 40
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Tests for the warm, embedding, load-test, benchmark-matrix and memory helpers
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+import psutil
+import pytest
+from click.testing import CliRunner
+
+from conftest import FakeLlama
+import easy_edge
+
+def read_boot_list(models_dir):
+    return json.loads((models_dir / "config.json").read_text()).get("warm_on_boot", [])
+
+def test_warm_save_validates_all_names_first(models_dir):
+    """An unknown name leaves the warm-on-boot list untouched, in memory and on disk"""
+    runner = CliRunner()
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "warm", "fake", "missing", "--save"])
+    assert result.exit_code == 0
+    assert "missing" in result.output
+    assert read_boot_list(models_dir) == []
+
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "warm", "fake", "--save"])
+    assert "Added 'fake'" in result.output
+    assert read_boot_list(models_dir) == ["fake"]
+
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "warm", "fake", "--forget"])
+    assert "Removed 'fake'" in result.output
+    assert read_boot_list(models_dir) == []
+
+def test_warm_save_and_forget_are_exclusive(models_dir):
+    """--save with --forget is an error rather than a silent --forget"""
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "warm", "fake", "--save", "--forget"])
+    assert "either --save or --forget" in result.output
+    assert read_boot_list(models_dir) == []
+
+def test_top_k_cosine_matches_argsort(tmp_path):
+    """Chunked top-k over a memory-mapped matrix agrees with a full argsort"""
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((1000, 16)).astype(np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    matrix = np.lib.format.open_memmap(tmp_path / "index.npy", mode="w+", dtype=np.float32, shape=rows.shape)
+    matrix[:] = rows
+    query = rows[123] + 0.1 * rng.standard_normal(16).astype(np.float32)
+    expected_order = np.argsort(-(rows @ query), kind="stable")
+    for k in (1, 10, 1000, 5000):
+        index, scores = easy_edge.top_k_cosine(matrix, query, k, chunk_rows=64)
+        assert index.tolist() == expected_order[:k].tolist()
+        np.testing.assert_allclose(scores, (rows @ query)[expected_order[:k]], rtol=1e-6)
+    assert easy_edge.top_k_cosine(matrix, query, 1)[0][0] == 123
+
+def test_embed_and_search_round_trip(models_dir, tmp_path):
+    """embed writes a normalised matrix and id sidecar that search ranks correctly"""
+    docs = tmp_path / "docs.jsonl"
+    docs.write_text(
+        json.dumps({"id": "pw", "text": "reset your password from the login page"}) + "\n"
+        + json.dumps({"id": "bill", "text": "invoices are emailed monthly"}) + "\n\n"
+        + json.dumps({"text": "shipping takes five days"}) + "\n"
+    )
+    runner = CliRunner()
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "embed", "--model", "fake",
+                                           "--input", str(docs), "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    matrix = np.load(tmp_path / "docs.npy")
+    assert matrix.shape == (3, 32)
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+    assert [json.loads(line) for line in (tmp_path / "docs.ids.jsonl").read_text().splitlines()] == ["pw", "bill", 4]
+
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "search", "--model", "fake",
+                                           "--index", str(tmp_path / "docs"), "--query", "password reset", "-k", "2"])
+    assert result.exit_code == 0, result.output
+    ranked = [line.split()[1] for line in result.output.splitlines() if line.strip()[:1].isdigit()]
+    assert ranked[0] == "pw"
+
+@pytest.mark.parametrize("lines, message", [
+    (['{"id": 1, "text": "fine"}', '{"id": 2, "body": "no text"}'], "docs.jsonl:2: no 'text' string field"),
+    (['{"text": "fine"}', '', '{"text": "cut off'], "docs.jsonl:3: invalid JSON"),
+    (['["a", "list"]'], "docs.jsonl:1: expected a JSON object"),
+    (['{"text": 42}'], "docs.jsonl:1: no 'text' string field"),
+])
+def test_embed_reports_bad_records_by_line(models_dir, tmp_path, lines, message):
+    """A malformed record is reported with its line number before the model is loaded"""
+    docs = tmp_path / "docs.jsonl"
+    docs.write_text("\n".join(lines) + "\n")
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "embed", "--model", "fake",
+                                                "--input", str(docs)])
+    assert result.exit_code == 0, result.output
+    assert message in result.output.replace("\n", "")
+    assert not (tmp_path / "docs.npy").exists()
+
+@pytest.mark.parametrize("batch_size", ["0", "-1"])
+def test_embed_rejects_non_positive_batch_size(models_dir, tmp_path, batch_size):
+    """A batch size below 1 is rejected up front instead of reaching llama_decode with no texts"""
+    docs = tmp_path / "docs.jsonl"
+    docs.write_text('{"text": "hello"}\n')
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "embed", "--model", "fake",
+                                                "--input", str(docs), "--batch-size", batch_size])
+    assert result.exit_code == 0, result.output
+    assert "--batch-size must be at least 1" in result.output
+    assert not (tmp_path / "docs.npy").exists()
+
+def load_step(rate, throughput, latency_p95, goodput=None, ttft_p95=0.1, latency_p99=None):
+    return {"rate": rate, "sent": 100, "completed": round(100 * throughput / rate),
+            "throughput": throughput, "goodput": throughput if goodput is None else goodput,
+            "ttft_p95": ttft_p95, "latency_p95": latency_p95,
+            "latency_p99": latency_p95 if latency_p99 is None else latency_p99}
+
+def test_find_saturation_point():
+    """The knee is the last rate served at >=90% of offered load with p95 inside the SLO"""
+    steps = [load_step(4, 3.0, 1.0), load_step(1, 1.0, 0.5), load_step(2, 1.95, 0.9), load_step(8, 7.9, 6.0)]
+    assert easy_edge.find_saturation_point(steps, slo=5.0) == 2
+    assert easy_edge.find_saturation_point(steps, slo=0.95) == 2
+    assert easy_edge.find_saturation_point(steps, slo=0.1) is None
+    assert easy_edge.find_saturation_point([load_step(1, 1.0, 0.5), load_step(2, 2.0, 0.5)], slo=5.0) == 2
+    assert easy_edge.find_saturation_point([], slo=5.0) is None
+
+def test_idle_server_is_not_saturated():
+    """An instant server is never flagged, however many Poisson arrivals a step happens to get"""
+    # 32 arrivals in a 2s step at 20 req/s: all served, though throughput is only 16 req/s
+    step = easy_edge.summarize_load_step([{"ok": True, "rejected": False, "ttft": 0.001, "latency": 0.005}] * 32,
+                                         0, 32, 2.0, 20, slo=5.0)
+    assert step["throughput"] < 0.9 * step["rate"]
+    assert easy_edge.find_saturation_point([step], slo=5.0) == 20
+
+    def send(prompt, client_id):
+        return {"ttft": 0.0, "latency": 0.0}
+    steps = []
+    for seed in range(3):
+        records, dropped, sent, elapsed = easy_edge.run_load_step(send, ["hi"], rate=20, duration=0.5, seed=seed)
+        steps.append(easy_edge.summarize_load_step(records, dropped, sent, elapsed, 20 + seed, slo=5.0))
+    assert easy_edge.find_saturation_point(steps, slo=5.0) == 22
+
+def test_compare_load_baseline():
+    """Latency increases and goodput drops beyond the threshold are reported per rate"""
+    baseline = [load_step(1, 1.0, 1.0), load_step(2, 2.0, 1.0, ttft_p95=0.0)]
+    steps = [load_step(1, 1.0, 1.05), load_step(2, 1.5, 1.5, ttft_p95=9.0), load_step(4, 0.1, 99.0)]
+    regressions = easy_edge.compare_load_baseline(steps, baseline, threshold=0.1)
+    assert regressions == [
+        "latency_p95 at 2 req/s: 1.000s -> 1.500s",
+        "latency_p99 at 2 req/s: 1.000s -> 1.500s",
+        "goodput at 2 req/s: 2.00 -> 1.50 req/s",
+    ]
+    assert easy_edge.compare_load_baseline(steps, baseline, threshold=1.0) == []
+
+def test_run_load_step_counts_drops_and_rejects_bad_arguments():
+    """Fixed arrivals past the concurrency limit are dropped; non-positive settings raise"""
+    release = threading.Event()
+    def send(prompt, client_id):
+        release.wait(5)
+        return {"ttft": 0.01, "latency": 0.02}
+    timer = threading.Timer(0.3, release.set)
+    timer.start()
+    records, dropped, sent, _ = easy_edge.run_load_step(send, ["hi"], rate=20, duration=0.24, arrival="fixed", concurrency=2)
+    timer.join()
+    assert sent == 5 and dropped == 3
+    assert len(records) == 2 and all(record["ok"] for record in records)
+    for kwargs in ({"rate": 0}, {"rate": float("inf")}, {"duration": 0}, {"concurrency": 0}):
+        arguments = {"rate": 1, "duration": 1, "concurrency": 1, **kwargs}
+        with pytest.raises(ValueError):
+            easy_edge.run_load_step(send, ["hi"], **arguments)
+
+@pytest.mark.parametrize("option, value, message", [
+    ("--rate", "0", "--rate values must be positive"),
+    ("--rate", "1,-2", "--rate values must be positive"),
+    ("--duration", "0", "--duration must be positive"),
+    ("--concurrency", "0", "--concurrency must be at least 1"),
+])
+def test_loadtest_rejects_non_positive_settings(models_dir, option, value, message):
+    """loadtest reports bad --rate, --duration and --concurrency instead of crashing or dropping everything"""
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "loadtest", "--model", "fake",
+                                                "--prompt", "Hi", option, value])
+    assert result.exit_code == 0, result.output
+    assert message in result.output
+
+@pytest.mark.parametrize("filename, expected", [
+    ("Llama-3.2-1B-Instruct-Q4_K_M.gguf", "Q4_K_M"),
+    ("qwen2.5-0.5b-instruct-q8_0.gguf", "Q8_0"),
+    ("model.IQ2_XXS.gguf", "IQ2_XXS"),
+    ("phi-3-mini-f16.gguf", "F16"),
+    ("gemma-2b-BF16.gguf", "BF16"),
+    ("Qwen2-7B-Instruct.gguf", "unknown"),
+    ("custom-model.gguf", "unknown"),
+])
+def test_model_quantization(filename, expected):
+    """Quantization is read from the original file name, falling back to the stored name"""
+    assert easy_edge.model_quantization({"original_filename": filename}) == expected
+    assert easy_edge.model_quantization({"filename": filename}) == expected
+
+def test_benchmark_matrix_default_ctx_fits_buckets_and_lists_skipped(models_dir, tmp_path):
+    """The default --ctx runs the 2048-token bucket; a smaller ctx names the cells it skips"""
+    output = tmp_path / "matrix.json"
+    runner = CliRunner()
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark-matrix",
+                                           "--prompt-tokens", "32,2048", "--gen-tokens", "8", "--output", str(output)])
+    assert result.exit_code == 0, result.output
+    assert "Skipping" not in result.output
+    rows = json.loads(output.read_text())
+    assert [(row["n_ctx"], row["prompt_tokens"], row["quant"]) for row in rows] == [(4096, 32, "Q4_0"), (4096, 2048, "Q4_0")]
+
+    result = runner.invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark-matrix", "--ctx", "2048",
+                                           "--prompt-tokens", "32,2048", "--gen-tokens", "8", "--output", str(output)])
+    assert "Skipping cells that do not fit in ctx=2048 (prompt+gen tokens): 2048+8" in result.output
+    assert len(json.loads(output.read_text())) == 1
+
+def test_benchmark_matrix_rejects_zero_repeat(models_dir, tmp_path):
+    """--repeat 0 is an error instead of an IndexError"""
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark-matrix", "--repeat", "0",
+                                                "--output", str(tmp_path / "matrix.csv")])
+    assert result.exit_code == 0, result.output
+    assert "--repeat must be at least 1" in result.output
+    assert not (tmp_path / "matrix.csv").exists()
+
+def test_memory_sampler_catches_transient_peak():
+    """A short-lived allocation inside the block shows up in the peak RSS and anonymous memory"""
+    process = psutil.Process()
+    before = process.memory_info().rss
+    with easy_edge.MemorySampler(interval=0.01, full_interval=10.0) as sampler:
+        block = bytearray(200 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])
+        time.sleep(0.2)
+        del block
+        time.sleep(0.05)
+    assert sampler.peak["rss"] >= before + 150 * 1024 * 1024
+    if sampler.peak["anon"] is not None:
+        assert sampler.peak["anon"] >= 150 * 1024 * 1024
+    assert sampler.samples >= 10
+    # USS/PSS are only read on entry and exit at this full_interval; the sampler's own CPU time is reported
+    assert sampler.full_samples <= 2
+    assert sampler.overhead > 0.0
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_memory_sampler_rejects_non_positive_interval(interval):
+    """A zero or negative interval would make the sampling thread spin on /proc reads"""
+    with pytest.raises(ValueError):
+        easy_edge.MemorySampler(interval=interval)
+    with pytest.raises(ValueError):
+        easy_edge.MemorySampler(full_interval=interval)
+
+@pytest.mark.parametrize("mem_interval", ["0", "-0.5"])
+def test_benchmark_rejects_non_positive_mem_interval(models_dir, mem_interval):
+    """--mem-interval 0 or below is rejected before any model is loaded"""
+    result = CliRunner().invoke(easy_edge.cli, ["--models-dir", str(models_dir), "benchmark", "--model", "fake",
+                                                "--prompt", "hi", "--mem-interval", mem_interval])
+    assert result.exit_code == 0, result.output
+    assert "--mem-interval must be positive" in result.output
+
+def test_estimate_context_memory():
+    """KV cache and compute buffer follow from the GGUF shape, n_ctx and n_ubatch"""
+    llm = FakeLlama(n_ctx=2048)
+    estimate = easy_edge.estimate_context_memory(llm)
+    # 2 bytes x 16 layers x 2048 positions x 8 KV heads x (64 + 64) head dims
+    assert estimate["kv_cache"] == 2 * 16 * 2048 * 8 * 128 == 64 * 1024 * 1024
+    # 4 bytes x 512 ubatch x (max(32000 vocab, 32 heads x 2048 ctx) + 4 x 2048 embd)
+    assert estimate["compute_buffer"] == 4 * 512 * (32 * 2048 + 4 * 2048)
+    assert easy_edge.estimate_context_memory(FakeLlama(n_ctx=4096))["kv_cache"] == 2 * estimate["kv_cache"]
+
+    class NoShape(FakeLlama):
+        metadata = {"general.architecture": "llama"}
+    assert easy_edge.estimate_context_memory(NoShape()) == {"kv_cache": None, "compute_buffer": None}